@@ -0,0 +1,182 @@
+"""Benchmark the structured JSON parser against the legacy free-text parser.
+
+Both parsers are fed synthetic Gemini responses generated from the same
+ground-truth analyses. A response counts as a failure when parsing raises or
+any category score differs from the ground truth (the legacy parser silently
+defaults missed scores to 5); failures that did not raise are also reported
+as silent. Free-text scores are written right after the category name 80% of
+the time, after reasoning containing other numbers 15% of the time and more
+than 100 characters away 5% of the time.
+
+JSON responses are corrupted at the same 20% rate by default (--malformed):
+half of those are truncated mid-response, as when output hits the token
+limit, a quarter are wrapped in a Markdown fence or followed by prose, and a
+quarter break the schema (a score as a string or out of range, or a missing
+field). The last row parses JSON and falls back to the legacy parser on the
+free-text rendering of the same analysis, as analyze_media does.
+
+Usage:
+    python benchmark_parsing.py --responses 2000 --repeat 5 --malformed 0.2
+"""
+import argparse
+import json
+import random
+import time
+
+from cat_content_analyzer import CatContentAnalyzer, CATEGORY_KEYS
+
+CAPTIONS = [
+    "Who else needs a nap this cozy? 😻 Tag a friend who sleeps like this!",
+    "Zoomies at 3am, as is tradition 🐾 Double tap if your cat does this too!",
+    "Caught in 4K being adorable 📸 What should we name this pose?",
+]
+
+REASONING = (
+    "The soft lighting and relaxed posture create an instant emotional response, "
+    "and the 2 front paws tucked under the chin are exactly the kind of detail "
+    "Instagram users love to save and share with friends."
+)
+
+def make_truth(rng):
+    """Generate a random ground-truth analysis."""
+    return {
+        'scores': {category: rng.randint(1, 10) for category in CATEGORY_KEYS},
+        'caption': rng.choice(CAPTIONS),
+        'hashtags': ['#catsofinstagram', '#catstagram', '#sleepycat', '#kitten'],
+        'engagement_tips': "Post the clip as a Reel and add a poll sticker asking followers to rate the nap.",
+        'key_strengths': "Relatable moment, strong eye contact and a clean background.",
+        'improvement_suggestions': "Crop to 4:5 and brighten the shadows slightly.",
+    }
+
+def render_text_response(truth, rng):
+    """Render a free-text response in one of the styles Gemini commonly returns."""
+    lines = ["## Instagram Virality Analysis", ""]
+    for i, (category, score) in enumerate(truth['scores'].items(), 1):
+        style = rng.random()
+        if style < 0.8:
+            # Score right after the category name
+            lines.append(f"**{i}. {category}: {score}/10**")
+            lines.append(REASONING)
+        elif style < 0.95:
+            # Reasoning with numbers before the score
+            lines.append(f"**{i}. {category}**")
+            lines.append(f"{REASONING} Score: {score}/10")
+        else:
+            # Score more than 100 characters after the category name
+            lines.append(f"**{i}. {category}**")
+            lines.append(f"{REASONING} {REASONING}")
+            lines.append(f"Score: {score}/10")
+        lines.append("")
+    lines += [
+        f"**Engaging Caption:** {truth['caption']}",
+        f"**Hashtag Strategy:** {' '.join(truth['hashtags'])}",
+        "**Posting Recommendations:** Tuesday at 11 AM ET.",
+        f"**Engagement Optimization:** {truth['engagement_tips']}",
+        f"**Key Strengths for Instagram:** {truth['key_strengths']}",
+        f"**Instagram-Specific Improvements:** {truth['improvement_suggestions']}",
+    ]
+    return "\n".join(lines)
+
+def render_json_response(truth):
+    """Render a response matching ANALYSIS_RESPONSE_SCHEMA."""
+    return json.dumps({
+        'scores': {CATEGORY_KEYS[c]: s for c, s in truth['scores'].items()},
+        'caption': truth['caption'],
+        'hashtags': truth['hashtags'],
+        'posting_recommendations': "Tuesday at 11 AM ET.",
+        'engagement_tips': truth['engagement_tips'],
+        'key_strengths': truth['key_strengths'],
+        'improvement_suggestions': truth['improvement_suggestions'],
+    })
+
+def corrupt_json_response(response, rng):
+    """Damage a JSON response in one of the ways structured output goes wrong."""
+    style = rng.random()
+    if style < 0.5:
+        # Truncated, e.g. the response hit the output token limit
+        return response[:rng.randint(1, len(response) - 1)]
+    if style < 0.625:
+        return f"```json\n{response}\n```"
+    if style < 0.75:
+        return f"{response}\n\nLet me know if you want a different caption!"
+    data = json.loads(response)
+    key = rng.choice(list(data['scores']))
+    if style < 0.85:
+        data['scores'][key] = str(data['scores'][key])
+    elif style < 0.95:
+        data['scores'][key] = rng.choice([0, 11, 15])
+    else:
+        del data[rng.choice(['caption', 'hashtags', 'key_strengths'])]
+    return json.dumps(data)
+
+def with_text_fallback(analyzer):
+    """Parse (json_response, text_response) pairs the way analyze_media does."""
+    def parse(responses):
+        json_response, text_response = responses
+        try:
+            return analyzer._parse_structured_analysis(json_response)
+        except ValueError:
+            return analyzer._parse_analysis(text_response)
+    return parse
+
+def run(parse, responses, truths, repeat):
+    """Time a parser over all responses and count failures and silent failures."""
+    best = float('inf')
+    failures = silent = 0
+    for _ in range(repeat):
+        failures = silent = 0
+        start = time.perf_counter()
+        for response, truth in zip(responses, truths):
+            try:
+                analysis = parse(response)
+                if analysis is None or analysis['scores'] != truth['scores']:
+                    failures += 1
+                    silent += 1
+            except ValueError:
+                failures += 1
+        best = min(best, time.perf_counter() - start)
+    return best, failures, silent
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--responses', type=int, default=2000, help="Number of synthetic responses")
+    parser.add_argument('--repeat', type=int, default=5, help="Timing repetitions (best is reported)")
+    parser.add_argument('--malformed', type=float, default=0.2,
+                        help="Share of JSON responses that are truncated or otherwise invalid")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    # Skip __init__ so no database or social media clients are touched;
+    # the parsers only need the category list.
+    analyzer = CatContentAnalyzer.__new__(CatContentAnalyzer)
+    analyzer.categories = list(CATEGORY_KEYS)
+    analyzer.instagram_hashtags = []
+
+    rng = random.Random(args.seed)
+    truths = [make_truth(rng) for _ in range(args.responses)]
+    text_responses = [render_text_response(truth, rng) for truth in truths]
+    json_responses = [
+        corrupt_json_response(render_json_response(truth), rng)
+        if rng.random() < args.malformed else render_json_response(truth)
+        for truth in truths
+    ]
+
+    results = {
+        'legacy text (_parse_analysis)': run(analyzer._parse_analysis, text_responses, truths, args.repeat),
+        'structured JSON (_parse_structured_analysis)': run(
+            analyzer._parse_structured_analysis, json_responses, truths, args.repeat
+        ),
+        'JSON with text fallback': run(
+            with_text_fallback(analyzer), list(zip(json_responses, text_responses)), truths, args.repeat
+        ),
+    }
+
+    print(f"{args.responses} responses, best of {args.repeat} runs\n")
+    print(f"{'Parser':<48}{'us/response':>14}{'failure rate':>16}{'silent':>10}")
+    for name, (elapsed, failures, silent) in results.items():
+        per_response = elapsed / args.responses * 1e6
+        print(f"{name:<48}{per_response:>14.1f}{failures / args.responses:>15.1%}"
+              f"{silent / args.responses:>10.1%}")
+
+if __name__ == "__main__":
+    main()
@@ -9,39 +9,237 @@ import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
 import re
-import sqlite3
-from social_media_manager import SocialMediaManager
+from social_media_manager import SocialMediaManager, TIKTOK_MAX_DURATION_SECONDS
+from media_scanner import MediaScanner, ScanIndex
+from job_queue import AnalysisJobQueue, make_worker_id
+from db import get_database, epoch_ms
+from migrations import migrate, CATEGORY_SCORE_COLUMNS
+from media_store import compute_file_hash
+from perceptual_hash import image_hashes, hash_to_hex, NearDuplicateIndex
+from rate_limiter import get_gemini_rate_limiter, is_rate_limit_error, GEMINI_ESTIMATED_TOKENS
+from media_processing import (
+    prepare_image_for_upload,
+    sample_video_frames,
+    make_contact_sheet,
+    probe_media,
+    MEDIA_PROBE_COLUMNS,
+    UPLOAD_MAX_EDGE,
+    UPLOAD_JPEG_QUALITY,
+    VIDEO_SAMPLE_FRAMES,
+    VIDEO_SAMPLING_MODE,
+    VIDEO_SAMPLING_MODES,
+)
 import streamlit as st
 import threading
-from contextlib import contextmanager
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-genai.configure(api_key=GEMINI_API_KEY)
-
-# Initialize the Gemini model DO NOT CHANGE THIS
+# Gemini model DO NOT CHANGE THIS
 #MODEL: gemini-2.0-flash
-model = genai.GenerativeModel('gemini-2.0-flash')
-
-# Thread-local storage for database connections
-thread_local = threading.local()
-
-@contextmanager
-def get_db_connection():
-    """Get a thread-safe database connection."""
-    if not hasattr(thread_local, "connection"):
-        thread_local.connection = sqlite3.connect('cat_content.db')
-    try:
-        yield thread_local.connection
-    except Exception as e:
-        thread_local.connection.rollback()
-        raise e
+GEMINI_MODEL_NAME = 'gemini-2.0-flash'
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Configure the Gemini API and build the model on first use."""
+    global _model
+    with _model_lock:
+        if _model is None:
+            genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+            _model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+        return _model
+
+# Supported media extensions
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+VIDEO_EXTENSIONS = ['.mp4', '.mov', '.avi']
+
+# Default number of Gemini requests kept in flight by analyze_many
+DEFAULT_MAX_CONCURRENCY = 4
+
+# Default number of images sent in one Gemini request by analyze_many
+DEFAULT_BATCH_SIZE = int(os.getenv('GEMINI_BATCH_SIZE', 1))
+
+# Seconds run_analysis waits for a running scan to queue more files once the
+# queue is empty
+SCAN_POLL_SECONDS = 0.5
+
+# Images whose pHash and dHash are both within this many bits (out of 64) of an
+# analyzed image reuse its analysis instead of calling Gemini; -1 disables
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', 6))
+
+# Retries and initial backoff (seconds) for rate-limited Gemini requests
+GEMINI_MAX_RETRIES = 3
+GEMINI_RETRY_BACKOFF = 5.0
+
+# Analyses written per transaction by save_many
+SAVE_CHUNK_SIZE = 1000
+
+# Version of the analysis prompt and parser. Bump this whenever the prompt in
+# analyze_media or _parse_analysis changes so cached analyses are not reused.
+ANALYSIS_VERSION = 4
+
+# Static Instagram analysis instructions shared by every request. They are
+# stored once as Gemini cached content (or sent as the system instruction when
+# caching is unavailable) instead of being repeated in each prompt.
+ANALYSIS_INSTRUCTIONS = """
+        You analyze images and videos of cats for Instagram virality potential, focusing on Instagram's specific engagement patterns and algorithm preferences.
+
+        Score each category from 1-10 and provide detailed reasoning with Instagram-specific insights:
+        1. Cuteness Factor (Instagram users' emotional response potential)
+        2. Action/Entertainment Value (Instagram engagement and save/share potential)
+        3. Uniqueness (Standing out in Instagram cat content)
+        4. Image/Video Quality (Instagram's visual quality standards)
+        5. Trend Alignment (Current Instagram cat content trends)
+        
+        For Instagram optimization, provide:
+        1. Engaging Caption:
+           - Write a caption that encourages interaction
+           - Include a call-to-action
+           - Use emojis strategically
+           - Keep it under 125 characters for optimal display
+        
+        2. Hashtag Strategy:
+           - Mix popular and niche cat hashtags (max 15)
+           - Include trending hashtags if relevant
+           - Order from most to least relevant
+        
+        3. Posting Recommendations:
+           - Best time to post for maximum reach
+           - Ideal day of the week
+           - Instagram-specific content tips
+        
+        4. Engagement Optimization:
+           - Suggestions for Instagram Stories/Reels potential
+           - Ideas for carousel posts if applicable
+           - Poll/Quiz suggestions for Stories
+        
+        5. Key Strengths for Instagram:
+           - What makes this content save-worthy
+           - Share potential
+           - Viral trigger elements
+        
+        6. Instagram-Specific Improvements:
+           - How to optimize for the Instagram algorithm
+           - Format/crop suggestions
+           - Enhancement ideas for better engagement
+        """
+
+# How long the cached analysis instructions live on Gemini
+ANALYSIS_CACHE_TTL = timedelta(hours=1)
+# Rough token count of the instructions (about four characters per token)
+ANALYSIS_INSTRUCTIONS_TOKENS = len(ANALYSIS_INSTRUCTIONS) // 4
+# Smallest prompt Gemini accepts as explicit cached content; shorter
+# instructions are sent as a system instruction without trying to cache them
+GEMINI_MIN_CACHE_TOKENS = int(os.getenv('GEMINI_MIN_CACHE_TOKENS', 4096))
+
+# Whether analyze_media asks Gemini for JSON matching ANALYSIS_RESPONSE_SCHEMA
+STRUCTURED_OUTPUT = os.getenv('GEMINI_STRUCTURED_OUTPUT', 'true').lower() != 'false'
+
+# Keys used for each category score in structured responses
+CATEGORY_KEYS = {
+    "Cuteness Factor": "cuteness_factor",
+    "Action/Entertainment Value": "action_entertainment_value",
+    "Uniqueness": "uniqueness",
+    "Image/Video Quality": "image_video_quality",
+    "Trend Alignment": "trend_alignment"
+}
+
+# Text fields expected in structured responses
+STRUCTURED_TEXT_FIELDS = [
+    'caption', 'engagement_tips', 'key_strengths', 'improvement_suggestions'
+]
+
+# JSON schema for structured analysis responses
+ANALYSIS_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'scores': {
+            'type': 'OBJECT',
+            'properties': {key: {'type': 'INTEGER'} for key in CATEGORY_KEYS.values()},
+            'required': list(CATEGORY_KEYS.values())
+        },
+        'caption': {'type': 'STRING'},
+        'hashtags': {'type': 'ARRAY', 'items': {'type': 'STRING'}},
+        'posting_recommendations': {'type': 'STRING'},
+        'engagement_tips': {'type': 'STRING'},
+        'key_strengths': {'type': 'STRING'},
+        'improvement_suggestions': {'type': 'STRING'}
+    },
+    'required': ['scores', 'hashtags'] + STRUCTURED_TEXT_FIELDS
+}
+
+# JSON schema for batched responses: one analysis per numbered image
+BATCH_RESPONSE_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'analyses': {
+            'type': 'ARRAY',
+            'items': {
+                'type': 'OBJECT',
+                'properties': {
+                    'image_number': {'type': 'INTEGER'},
+                    **ANALYSIS_RESPONSE_SCHEMA['properties']
+                },
+                'required': ['image_number'] + ANALYSIS_RESPONSE_SCHEMA['required']
+            }
+        }
+    },
+    'required': ['analyses']
+}
+
+# Section header used to split free-text batched responses
+BATCH_SECTION_PATTERN = re.compile(r'^\s*=+\s*IMAGE\s+(\d+)\s*=+\s*$', re.IGNORECASE | re.MULTILINE)
+
+_analysis_model = None
+_analysis_model_expires = None
+_analysis_model_lock = threading.Lock()
+
+def get_analysis_model():
+    """Get a model that carries ANALYSIS_INSTRUCTIONS.
+
+    Instructions of at least GEMINI_MIN_CACHE_TOKENS are stored once as
+    Gemini cached content and referenced by every call. Shorter instructions,
+    or any when context caching is unavailable, are attached as a system
+    instruction, which keeps the prompt prefix stable for implicit caching.
+    """
+    global _analysis_model, _analysis_model_expires
+    with _analysis_model_lock:
+        now = datetime.now(pytz.UTC)
+        if _analysis_model is not None and (_analysis_model_expires is None or now < _analysis_model_expires):
+            return _analysis_model
+        if ANALYSIS_INSTRUCTIONS_TOKENS < GEMINI_MIN_CACHE_TOKENS:
+            _analysis_model = genai.GenerativeModel(get_model().model_name, system_instruction=ANALYSIS_INSTRUCTIONS)
+            _analysis_model_expires = None
+            return _analysis_model
+        try:
+            from google.generativeai import caching
+            # Cache creation counts against the same quota as generate_content
+            with get_gemini_rate_limiter().limit(ANALYSIS_INSTRUCTIONS_TOKENS):
+                cached_content = caching.CachedContent.create(
+                    model=get_model().model_name,
+                    display_name='cat-content-analysis-instructions',
+                    system_instruction=ANALYSIS_INSTRUCTIONS,
+                    ttl=ANALYSIS_CACHE_TTL
+                )
+            _analysis_model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+            # Refresh a little before Gemini expires the cache
+            _analysis_model_expires = now + ANALYSIS_CACHE_TTL - timedelta(minutes=5)
+        except Exception as e:
+            print(f"Context caching unavailable, sending instructions as a system instruction: {e}")
+            _analysis_model = genai.GenerativeModel(get_model().model_name, system_instruction=ANALYSIS_INSTRUCTIONS)
+            _analysis_model_expires = None
+        return _analysis_model
 
 class CatContentAnalyzer:
-    def __init__(self):
+    def __init__(self, upload_max_edge=UPLOAD_MAX_EDGE, upload_quality=UPLOAD_JPEG_QUALITY,
+                 video_frames=VIDEO_SAMPLE_FRAMES, video_sampling=VIDEO_SAMPLING_MODE,
+                 structured_output=STRUCTURED_OUTPUT):
         self.categories = [
             "Cuteness Factor",
             "Action/Entertainment Value",
@@ -55,128 +253,120 @@ class CatContentAnalyzer:
             "#meow", "#catlife", "#instacat", "#catlovers", "#catlover",
             "#catoftheday", "#catlove", "#kitten", "#pets", "#catworld"
         ]
-        self.social_media = SocialMediaManager()
+        # Social media clients are created on first use
+        self._social_media = None
+        # Image normalization settings for Gemini uploads
+        self.upload_max_edge = upload_max_edge
+        self.upload_quality = upload_quality
+        # Video frame sampling settings ('uniform' or 'scene')
+        self.video_frames = video_frames
+        self.video_sampling = video_sampling
+        # Ask Gemini for schema-validated JSON instead of free text
+        self.structured_output = structured_output
+        # Analysis cache statistics
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.near_duplicate_hits = 0
+        self._cache_lock = threading.Lock()
+        # Perceptual hash index of analyzed images, loaded on first use
+        self._near_duplicates = None
+        self._near_duplicates_lock = threading.Lock()
         self._init_database()
 
-    def _init_database(self):
-        """Initialize SQLite database and create necessary tables."""
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            # Create tables if they don't exist
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS content_analysis (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_path TEXT,
-                original_filename TEXT,
-                media_type TEXT,
-                total_score INTEGER,
-                caption TEXT,
-                hashtags TEXT,
-                engagement_tips TEXT,
-                key_strengths TEXT,
-                improvement_suggestions TEXT,
-                timestamp DATETIME,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-            ''')
+    @property
+    def social_media(self):
+        """Social media manager, created the first time something is posted."""
+        if self._social_media is None:
+            self._social_media = SocialMediaManager()
+        return self._social_media
 
-            # Add file_hash column if it doesn't exist
-            cursor.execute('''
-            SELECT COUNT(*) FROM pragma_table_info('content_analysis') WHERE name='file_hash'
-            ''')
-            if cursor.fetchone()[0] == 0:
-                cursor.execute('''
-                ALTER TABLE content_analysis ADD COLUMN file_hash TEXT
-                ''')
+    def _init_database(self):
+        """Bring the SQLite schema up to date (see migrations.py)."""
+        migrate(get_database())
 
-            # Add index on file_hash for faster duplicate checking
-            cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_content_analysis_file_hash 
-            ON content_analysis(file_hash)
-            ''')
+    def _save_to_database(self, analysis):
+        """Save analysis results to SQLite database."""
+        return self.save_many([analysis])[0]
 
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS category_scores (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                analysis_id INTEGER,
-                category TEXT,
-                score INTEGER,
-                FOREIGN KEY (analysis_id) REFERENCES content_analysis (id)
-            )
-            ''')
+    def save_many(self, analyses, chunk_size=SAVE_CHUNK_SIZE):
+        """Save many analyses with one write transaction per chunk.
 
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS posting_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                analysis_id INTEGER,
-                platform TEXT,
-                status TEXT,
-                posted_at DATETIME,
-                error_message TEXT,
-                updated_at DATETIME,
-                FOREIGN KEY (analysis_id) REFERENCES content_analysis (id)
-            )
-            ''')
+        Each chunk's analyses and category scores go in with one
+        ``executemany`` each, so bulk imports pay for one commit per chunk
+        instead of one per analysis. Sets ``id`` on every analysis and
+        returns the new ids in order.
+        """
+        analyses = list(analyses)
+        analysis_ids = []
+        for start in range(0, len(analyses), chunk_size):
+            chunk = analyses[start:start + chunk_size]
+            with get_database().write() as conn:
+                cursor = conn.cursor()
+                try:
+                    # Insert main analysis data
+                    cursor.executemany('''
+                    INSERT INTO content_analysis (
+                        file_path, original_filename, media_type, total_score,
+                        caption, hashtags, engagement_tips, key_strengths,
+                        improvement_suggestions, timestamp, file_hash,
+                        analysis_version, usage_id, phash, dhash, near_duplicate_of,
+                        mime_type, width, height, duration, fps, bitrate, file_size,
+                        cuteness_score, entertainment_score, uniqueness_score, quality_score, trend_score
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', [(
+                        analysis['file_path'],
+                        analysis.get('original_filename', os.path.basename(analysis['file_path'])),
+                        analysis['media_type'],
+                        analysis['total_score'],
+                        analysis['caption'],
+                        analysis['hashtags'],
+                        analysis['engagement_tips'],
+                        analysis['key_strengths'],
+                        analysis['improvement_suggestions'],
+                        analysis['timestamp'],
+                        analysis.get('file_hash'),
+                        analysis.get('analysis_version'),
+                        analysis.get('usage_id'),
+                        analysis.get('phash'),
+                        analysis.get('dhash'),
+                        analysis.get('near_duplicate_of'),
+                        analysis.get('mime_type'),
+                        analysis.get('width'),
+                        analysis.get('height'),
+                        analysis.get('duration'),
+                        analysis.get('fps'),
+                        analysis.get('bitrate'),
+                        analysis.get('file_size'),
+                        *(analysis['scores'].get(category) for category in CATEGORY_SCORE_COLUMNS)
+                    ) for analysis in chunk])
 
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS engagement_metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                post_id INTEGER,
-                platform TEXT,
-                likes INTEGER DEFAULT 0,
-                comments INTEGER DEFAULT 0,
-                shares INTEGER DEFAULT 0,
-                views INTEGER DEFAULT 0,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (post_id) REFERENCES content_analysis (id)
-            )
-            ''')
-            conn.commit()
+                    # The transaction holds the write lock and AUTOINCREMENT
+                    # hands out ids in order, so the chunk's rows have
+                    # consecutive ids ending at the last inserted one
+                    last_id = cursor.execute('SELECT last_insert_rowid()').fetchone()[0]
+                    chunk_ids = range(last_id - len(chunk) + 1, last_id + 1)
 
-    def _save_to_database(self, analysis):
-        """Save analysis results to SQLite database."""
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            try:
-                # Insert main analysis data
-                cursor.execute('''
-                INSERT INTO content_analysis (
-                    file_path, original_filename, media_type, total_score,
-                    caption, hashtags, engagement_tips, key_strengths,
-                    improvement_suggestions, timestamp
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    analysis['file_path'],
-                    analysis.get('original_filename', os.path.basename(analysis['file_path'])),
-                    analysis['media_type'],
-                    analysis['total_score'],
-                    analysis['caption'],
-                    analysis['hashtags'],
-                    analysis['engagement_tips'],
-                    analysis['key_strengths'],
-                    analysis['improvement_suggestions'],
-                    analysis['timestamp']
-                ))
-                
-                analysis_id = cursor.lastrowid
-
-                # Insert category scores
-                for category, score in analysis['scores'].items():
-                    cursor.execute('''
+                    # Insert category scores
+                    cursor.executemany('''
                     INSERT INTO category_scores (analysis_id, category, score)
                     VALUES (?, ?, ?)
-                    ''', (analysis_id, category, score))
-
-                conn.commit()
-                return analysis_id
-            except Exception as e:
-                conn.rollback()
-                print(f"Error saving to database: {e}")
-                raise
+                    ''', [
+                        (analysis_id, category, score)
+                        for analysis_id, analysis in zip(chunk_ids, chunk)
+                        for category, score in analysis['scores'].items()
+                    ])
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error saving to database: {e}")
+                    raise
+            for analysis_id, analysis in zip(chunk_ids, chunk):
+                analysis['id'] = analysis_id
+            analysis_ids.extend(chunk_ids)
+        return analysis_ids
 
     def _load_from_database(self, analysis_id):
         """Load analysis results from SQLite database."""
-        with get_db_connection() as conn:
+        with get_database().read() as conn:
             cursor = conn.cursor()
             try:
                 # Get main analysis data
@@ -187,12 +377,22 @@ class CatContentAnalyzer:
 
                 if not analysis_data:
                     return None
+                columns = [description[0] for description in cursor.description]
+                row = dict(zip(columns, analysis_data))
 
-                # Get category scores
-                cursor.execute('''
-                SELECT category, score FROM category_scores WHERE analysis_id = ?
-                ''', (analysis_id,))
-                scores = {row[0]: row[1] for row in cursor.fetchall()}
+                # Category scores are stored on the row itself
+                scores = {
+                    category: row[column]
+                    for category, column in CATEGORY_SCORE_COLUMNS.items()
+                    if row.get(column) is not None
+                }
+                if not scores:
+                    # Saved by a version that only wrote category_scores and
+                    # not backfilled yet
+                    cursor.execute('''
+                    SELECT category, score FROM category_scores WHERE analysis_id = ?
+                    ''', (analysis_id,))
+                    scores = {category: score for category, score in cursor.fetchall()}
 
                 # Reconstruct analysis dictionary
                 analysis = {
@@ -208,21 +408,157 @@ class CatContentAnalyzer:
                     'timestamp': analysis_data[10],
                     'scores': scores
                 }
+                analysis.update({column: row.get(column) for column in MEDIA_PROBE_COLUMNS})
 
                 return analysis
             except Exception as e:
                 print(f"Error loading from database: {e}")
                 return None
 
+    def _get_cached_analysis(self, file_hash):
+        """Return the stored analysis for a content hash at the current analysis version."""
+        with get_database().read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT id FROM content_analysis
+            WHERE file_hash = ? AND analysis_version = ?
+            ORDER BY id DESC
+            LIMIT 1
+            ''', (file_hash, ANALYSIS_VERSION))
+            row = cursor.fetchone()
+
+        if not row:
+            return None
+
+        analysis = self._load_from_database(row[0])
+        if analysis:
+            analysis['id'] = row[0]
+            analysis['file_hash'] = file_hash
+            analysis['analysis_version'] = ANALYSIS_VERSION
+        return analysis
+
+    def load_cached_analyses(self, entries):
+        """Add stored analyses for ``(file_path, file_hash)`` pairs to analyzed_content.
+
+        Used for files a scan skipped as unchanged, so they can be scheduled
+        without being hashed or re-analyzed.
+        """
+        for file_path, file_hash in entries:
+            analysis = self._get_cached_analysis(file_hash)
+            if analysis:
+                analysis['file_path'] = str(file_path)
+                self.analyzed_content.append(analysis)
+
+    def _record_cache_result(self, hit):
+        """Update the cache hit/miss counters."""
+        with self._cache_lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def cache_stats(self):
+        """Get analysis cache hit/miss counters."""
+        with self._cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_rate': self.cache_hits / total if total else 0.0,
+                'near_duplicates': self.near_duplicate_hits
+            }
+
+    def _get_near_duplicate_index(self):
+        """Load perceptual hashes of current-version analyses into a BK-tree index."""
+        with self._near_duplicates_lock:
+            if self._near_duplicates is None:
+                with get_database().read() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute('''
+                    SELECT id, phash, dhash FROM content_analysis
+                    WHERE phash IS NOT NULL AND dhash IS NOT NULL
+                    AND near_duplicate_of IS NULL AND analysis_version = ?
+                    ''', (ANALYSIS_VERSION,))
+                    entries = [(row[0], int(row[1], 16), int(row[2], 16)) for row in cursor.fetchall()]
+                self._near_duplicates = NearDuplicateIndex(NEAR_DUPLICATE_MAX_DISTANCE, entries)
+            return self._near_duplicates
+
+    def _claim_near_duplicate(self, file_path):
+        """Hash an image and look for a near-duplicate that was (or is being) analyzed.
+
+        Returns ``(hashes, entry, owner)``. ``owner`` is True when this call
+        must analyze the image and resolve ``entry``; otherwise ``entry``
+        belongs to a near-duplicate whose analysis can be reused. ``entry``
+        is None when detection is disabled or the image could not be hashed.
+        """
+        if NEAR_DUPLICATE_MAX_DISTANCE < 0:
+            return None, None, True
+        try:
+            hashes = image_hashes(file_path)
+        except Exception as e:
+            print(f"Could not compute perceptual hash for {Path(file_path).name}: {e}")
+            return None, None, True
+        entry, owner = self._get_near_duplicate_index().claim(*hashes)
+        return hashes, entry, owner
+
+    def _reuse_near_duplicate(self, entry, file_path, file_hash, hashes, original_filename=None):
+        """Save a copy of a near-duplicate's analysis for this file.
+
+        Waits for the near-duplicate's analysis if it is still running.
+        Returns None if that analysis failed or can no longer be loaded.
+        """
+        analysis_id = entry.wait()
+        analysis = self._load_from_database(analysis_id) if analysis_id else None
+        if analysis is None:
+            return None
+        with self._cache_lock:
+            self.near_duplicate_hits += 1
+        print(f"{Path(file_path).name} is a near-duplicate of analysis {analysis_id}, reusing it")
+        analysis['near_duplicate_of'] = analysis_id
+        analysis['timestamp'] = datetime.now(pytz.UTC)
+        analysis['phash'], analysis['dhash'] = (hash_to_hex(h) for h in hashes)
+        return self._store_analysis(analysis, file_path, False, file_hash, None, original_filename)
+
+    def invalidate_cache(self, file_hash=None):
+        """Stop reusing stored analyses, for one content hash or for all content.
+
+        Rows are kept for history; they are only excluded from cache lookups so
+        the next analyze_media call re-runs Gemini. Returns the number of
+        invalidated analyses.
+        """
+        with get_database().write() as conn:
+            cursor = conn.cursor()
+            try:
+                if file_hash:
+                    cursor.execute('''
+                    UPDATE content_analysis SET analysis_version = NULL
+                    WHERE analysis_version IS NOT NULL AND file_hash = ?
+                    ''', (file_hash,))
+                else:
+                    cursor.execute('''
+                    UPDATE content_analysis SET analysis_version = NULL
+                    WHERE analysis_version IS NOT NULL
+                    ''')
+                conn.commit()
+                # Invalidated analyses must not be reused for near-duplicates either
+                with self._near_duplicates_lock:
+                    self._near_duplicates = None
+                return cursor.rowcount
+            except Exception as e:
+                conn.rollback()
+                print(f"Error invalidating analysis cache: {e}")
+                raise
+
     def record_post(self, analysis_id, platform, status):
         """Record posting history in the database."""
-        with get_db_connection() as conn:
+        posted_at_ms = epoch_ms()
+        with get_database().write() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute('''
-                INSERT INTO posting_history (analysis_id, platform, status, posted_at)
-                VALUES (?, ?, ?, ?)
-                ''', (analysis_id, platform, status, datetime.now(pytz.UTC)))
+                INSERT INTO posting_history (analysis_id, platform, status, posted_at_ms, posted_at)
+                VALUES (?, ?, ?, ?, datetime(? / 1000, 'unixepoch'))
+                ''', (analysis_id, platform, status, posted_at_ms, posted_at_ms))
                 conn.commit()
             except Exception as e:
                 conn.rollback()
@@ -230,114 +566,511 @@ class CatContentAnalyzer:
 
     def get_posting_history(self):
         """Get posting history from the database."""
-        with get_db_connection() as conn:
+        with get_database().read() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute('''
                 SELECT ca.original_filename, ph.platform, ph.status, ph.posted_at
                 FROM posting_history ph
                 JOIN content_analysis ca ON ph.analysis_id = ca.id
-                ORDER BY ph.posted_at DESC
+                ORDER BY ph.posted_at_ms DESC
                 ''')
                 return cursor.fetchall()
             except Exception as e:
                 print(f"Error getting posting history: {e}")
                 return []
 
-    def analyze_media(self, media_path):
-        """Analyze a single media file (image or video)."""
+    def _generate_content(self, contents, request_type, media_count=1,
+                          estimated_tokens=GEMINI_ESTIMATED_TOKENS, **kwargs):
+        """Call Gemini through the shared rate limiter, retrying on 429s.
+
+        Every Gemini request made by the analyzer goes through here so that
+        all processes share one requests/tokens budget and every call's token
+        usage and latency is recorded. Returns ``(response, usage_id)``.
+        """
+        limiter = get_gemini_rate_limiter()
+        analysis_model = get_analysis_model()
+        for attempt in range(GEMINI_MAX_RETRIES + 1):
+            try:
+                with limiter.limit(estimated_tokens) as usage:
+                    start = time.monotonic()
+                    response = analysis_model.generate_content(contents, **kwargs)
+                    response.resolve()
+                    latency = time.monotonic() - start
+                    usage_metadata = getattr(response, 'usage_metadata', None)
+                    if usage_metadata is not None:
+                        usage['total_tokens'] = usage_metadata.total_token_count
+                usage_id = self._record_usage(usage_metadata, latency, request_type, media_count)
+                return response, usage_id
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == GEMINI_MAX_RETRIES:
+                    raise
+                backoff = GEMINI_RETRY_BACKOFF * 2 ** attempt
+                print(f"Gemini rate limit hit, retrying in {backoff:.0f}s: {e}")
+                time.sleep(backoff)
+
+    def _record_usage(self, usage_metadata, latency, request_type, media_count):
+        """Record token usage and latency of a Gemini call."""
+        with get_database().write() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                INSERT INTO gemini_usage (
+                    request_type, model, media_count, prompt_tokens, output_tokens,
+                    cached_tokens, total_tokens, latency_ms
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    request_type,
+                    get_model().model_name,
+                    media_count,
+                    getattr(usage_metadata, 'prompt_token_count', None),
+                    getattr(usage_metadata, 'candidates_token_count', None),
+                    getattr(usage_metadata, 'cached_content_token_count', None),
+                    getattr(usage_metadata, 'total_token_count', None),
+                    int(latency * 1000)
+                ))
+                conn.commit()
+                return cursor.lastrowid
+            except Exception as e:
+                conn.rollback()
+                print(f"Error recording Gemini usage: {e}")
+                return None
+
+    def get_usage_summary(self):
+        """Summarize recorded Gemini token usage and latency per analysis."""
+        with get_database().read() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+            SELECT
+                COUNT(*),
+                SUM(media_count),
+                SUM(prompt_tokens),
+                SUM(output_tokens),
+                SUM(cached_tokens),
+                AVG(latency_ms)
+            FROM gemini_usage
+            ''')
+            requests, media, prompt_tokens, output_tokens, cached_tokens, latency_ms = cursor.fetchone()
+
+        media = media or 0
+        return {
+            'requests': requests,
+            'analyses': media,
+            'prompt_tokens_per_analysis': (prompt_tokens or 0) / media if media else 0,
+            'output_tokens_per_analysis': (output_tokens or 0) / media if media else 0,
+            'cached_token_share': (cached_tokens or 0) / prompt_tokens if prompt_tokens else 0,
+            'avg_latency_ms': latency_ms or 0
+        }
+
+    def _build_prompt(self, is_video):
+        """Build the per-request part of the analysis prompt.
+
+        The static instructions are sent separately as ANALYSIS_INSTRUCTIONS.
+        """
+        return f"""
+        Analyze this {'video' if is_video else 'image'} of a cat for Instagram virality potential.
+        {'The video is provided as a contact sheet of frames sampled across the clip, in order from left to right and top to bottom.' if is_video else ''}
+        """
+
+    def analyze_media(self, media_path, use_cache=True, file_hash=None, original_filename=None):
+        """Analyze a single media file (image or video).
+
+        Content that was already analyzed with the current ANALYSIS_VERSION is
+        returned from the database without calling Gemini unless ``use_cache``
+        is False. Pass ``file_hash`` when the caller already hashed the file
+        (e.g. with save_and_hash) to avoid reading it again, and
+        ``original_filename`` when the file was stored under another name.
+        """
         file_path = Path(media_path)
         
         if not file_path.exists():
             raise FileNotFoundError(f"Media file not found: {media_path}")
 
+        if file_hash is None:
+            file_hash = compute_file_hash(file_path)
+        if use_cache:
+            cached_analysis = self._get_cached_analysis(file_hash)
+            self._record_cache_result(cached_analysis is not None)
+            if cached_analysis:
+                cached_analysis['file_path'] = str(file_path)
+                self.analyzed_content.append(cached_analysis)
+                return cached_analysis
+
         # Determine if it's an image or video
-        is_video = file_path.suffix.lower() in ['.mp4', '.mov', '.avi']
-        
-        # Generate Instagram-specific analysis prompt
-        prompt = f"""
-        Analyze this {'video' if is_video else 'image'} of a cat for Instagram virality potential, focusing on Instagram's specific engagement patterns and algorithm preferences.
+        is_video = file_path.suffix.lower() in VIDEO_EXTENSIONS
 
-        Score each category from 1-10 and provide detailed reasoning with Instagram-specific insights:
-        1. Cuteness Factor (Instagram users' emotional response potential)
-        2. Action/Entertainment Value (Instagram engagement and save/share potential)
-        3. Uniqueness (Standing out in Instagram cat content)
-        4. Image/Video Quality (Instagram's visual quality standards)
-        5. Trend Alignment (Current Instagram cat content trends)
-        
-        For Instagram optimization, provide:
-        1. Engaging Caption:
-           - Write a caption that encourages interaction
-           - Include a call-to-action
-           - Use emojis strategically
-           - Keep it under 125 characters for optimal display
-        
-        2. Hashtag Strategy:
-           - Mix popular and niche cat hashtags (max 15)
-           - Include trending hashtags if relevant
-           - Order from most to least relevant
-        
-        3. Posting Recommendations:
-           - Best time to post for maximum reach
-           - Ideal day of the week
-           - Instagram-specific content tips
-        
-        4. Engagement Optimization:
-           - Suggestions for Instagram Stories/Reels potential
-           - Ideas for carousel posts if applicable
-           - Poll/Quiz suggestions for Stories
-        
-        5. Key Strengths for Instagram:
-           - What makes this content save-worthy
-           - Share potential
-           - Viral trigger elements
-        
-        6. Instagram-Specific Improvements:
-           - How to optimize for the Instagram algorithm
-           - Format/crop suggestions
-           - Enhancement ideas for better engagement
-        """
+        # Reuse the analysis of a near-identical image, such as another burst shot
+        hashes, near_duplicate = None, None
+        if use_cache and not is_video:
+            hashes, near_duplicate, owner = self._claim_near_duplicate(file_path)
+            if not owner:
+                analysis = self._reuse_near_duplicate(
+                    near_duplicate, file_path, file_hash, hashes, original_filename
+                )
+                if analysis:
+                    return analysis
+                # The near-duplicate's analysis failed, so analyze this image instead
+                near_duplicate = None
 
         try:
             if is_video:
-                # For videos, use the first frame
-                import cv2
-                cap = cv2.VideoCapture(str(file_path))
-                ret, frame = cap.read()
-                if ret:
-                    # Convert BGR to RGB
-                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    # Convert to PIL Image
-                    image = Image.fromarray(frame)
-                    cap.release()
-                else:
-                    raise Exception("Could not read video file")
+                # For videos, send a contact sheet of frames sampled across the clip
+                frames = sample_video_frames(file_path, self.video_frames, self.video_sampling)
+                contact_sheet = make_contact_sheet([frame for _, frame in frames])
+                image, upload_stats = prepare_image_for_upload(
+                    contact_sheet, self.upload_max_edge, self.upload_quality
+                )
             else:
-                # For images, use PIL
-                image = Image.open(file_path)
+                # For images, orient, downscale and re-encode before upload
+                image, upload_stats = prepare_image_for_upload(
+                    file_path, self.upload_max_edge, self.upload_quality
+                )
+            if upload_stats['bytes_saved'] is not None:
+                print(f"Uploading {file_path.name}: {upload_stats['upload_bytes']} bytes "
+                      f"({upload_stats['bytes_saved']} bytes saved)")
+            analysis = self._analyze_prepared(
+                file_path, is_video, file_hash, image, upload_stats, hashes, original_filename
+            )
+            if near_duplicate:
+                near_duplicate.resolve(analysis['id'])
+            return analysis
+            
+        except Exception as e:
+            if near_duplicate:
+                near_duplicate.resolve(None)
+            print(f"Error analyzing media: {e}")
+            raise
+
+    def _analyze_prepared(self, file_path, is_video, file_hash, image, upload_stats, hashes=None,
+                          original_filename=None):
+        """Analyze one image already prepared for upload and save the result.
 
+        ``image`` and ``upload_stats`` come from prepare_image_for_upload, and
+        ``hashes`` are the image's perceptual hashes, stored with the analysis
+        so later near-duplicates can reuse it.
+        """
+        # Generate Instagram-specific analysis prompt
+        prompt = self._build_prompt(is_video)
+
+        analysis = None
+        if self.structured_output:
+            # Ask for JSON matching the schema and validate it in one parse
+            response, usage_id = self._generate_content(
+                [prompt, image],
+                'structured',
+                generation_config=genai.GenerationConfig(
+                    response_mime_type='application/json',
+                    response_schema=ANALYSIS_RESPONSE_SCHEMA
+                )
+            )
+            try:
+                analysis = self._parse_structured_analysis(response.text)
+            except ValueError as e:
+                print(f"Invalid structured response for {file_path.name}, falling back to text: {e}")
+
+        if analysis is None:
             # Generate content using the model
-            response = model.generate_content([prompt, image])
-            response.resolve()
+            response, usage_id = self._generate_content([prompt, image], 'text')
 
             # Parse the response and extract scores
             analysis = self._parse_analysis(response.text)
-            analysis['file_path'] = str(file_path)
-            analysis['media_type'] = 'video' if is_video else 'image'
-            
-            # Save to database
-            analysis_id = self._save_to_database(analysis)
-            analysis['id'] = analysis_id
-            
-            self.analyzed_content.append(analysis)
-            return analysis
-            
+        analysis['usage_id'] = usage_id
+        if hashes:
+            analysis['phash'], analysis['dhash'] = (hash_to_hex(h) for h in hashes)
+        return self._store_analysis(
+            analysis, file_path, is_video, file_hash, upload_stats, original_filename
+        )
+
+    def _store_analysis(self, analysis, file_path, is_video, file_hash, upload_stats, original_filename=None):
+        """Attach file metadata to a parsed analysis and save it to the database."""
+        analysis['file_path'] = str(file_path)
+        analysis['original_filename'] = original_filename or Path(file_path).name
+        analysis['media_type'] = 'video' if is_video else 'image'
+        analysis['file_hash'] = file_hash
+        analysis['analysis_version'] = ANALYSIS_VERSION
+        analysis['upload_stats'] = upload_stats
+        analysis.update(probe_media(file_path))
+        
+        # Save to database
+        analysis_id = self._save_to_database(analysis)
+        analysis['id'] = analysis_id
+        
+        self.analyzed_content.append(analysis)
+        return analysis
+
+    def _build_batch_prompt(self, image_count):
+        """Build the prompt for analyzing several numbered images in one request."""
+        header = f"""
+        You are given {image_count} separate images, each preceded by a label "Image N" (N = 1 to {image_count}).
+        Analyze every image independently using the instructions below. Do not compare the images or mix their details.
+        """
+        if self.structured_output:
+            header += """
+        Return one entry in "analyses" per image, with "image_number" set to the image's label number.
+        """
+        else:
+            header += """
+        Start each image's section with a line containing only "=== IMAGE N ===" and write nothing before the first section.
+        """
+        return header
+
+    def _split_batch_response(self, response_text, image_count):
+        """Split a batched response into per-image analyses keyed by image number.
+
+        Images whose section is missing, duplicated or fails to parse are left
+        out so the caller can re-analyze them individually.
+        """
+        analyses = {}
+        if self.structured_output:
+            try:
+                items = json.loads(response_text).get('analyses')
+            except (AttributeError, TypeError, json.JSONDecodeError):
+                return analyses
+            if not isinstance(items, list):
+                return analyses
+            counts = {}
+            for item in items:
+                if isinstance(item, dict) and isinstance(item.get('image_number'), int):
+                    counts[item['image_number']] = counts.get(item['image_number'], 0) + 1
+            for item in items:
+                if not isinstance(item, dict):
+                    continue
+                number = item.get('image_number')
+                if not isinstance(number, int) or not 1 <= number <= image_count or counts[number] > 1:
+                    continue
+                try:
+                    analyses[number] = self._structured_to_analysis(item)
+                except ValueError as e:
+                    print(f"Invalid analysis for image {number} in batch: {e}")
+            return analyses
+
+        parts = BATCH_SECTION_PATTERN.split(response_text)
+        # parts = [preamble, number, section, number, section, ...]
+        numbers = [int(number) for number in parts[1::2]]
+        for number, section in zip(numbers, parts[2::2]):
+            if not 1 <= number <= image_count or numbers.count(number) > 1:
+                continue
+            # Only accept sections where every category score was found
+            if not all(category in section for category in self.categories):
+                continue
+            analysis = self._parse_analysis(section)
+            if analysis:
+                analyses[number] = analysis
+        return analyses
+
+    def analyze_batch(self, media_paths, use_cache=True):
+        """Analyze several media files, sending all uncached images in one Gemini request.
+
+        Cached content is returned from the database and videos are analyzed
+        individually. Near-duplicates of analyzed images (including other
+        images in this batch) reuse that analysis. The batched response is
+        split back into one analysis per image, each saved through
+        ``_save_to_database``; images that do not split cleanly are sent again
+        on their own, reusing their file hash, prepared upload and perceptual
+        hashes. Returns
+        ``[(media_path, analysis, error), ...]`` like ``analyze_many``.
+        """
+        results = []
+        batch = []
+        # Near-duplicates are only waited on once this batch's own claims are resolved
+        near_duplicates = []
+        for media_path in media_paths:
+            file_path = Path(media_path)
+            try:
+                if not file_path.exists():
+                    raise FileNotFoundError(f"Media file not found: {media_path}")
+                if file_path.suffix.lower() in VIDEO_EXTENSIONS:
+                    results.append((media_path, self.analyze_media(media_path, use_cache), None))
+                    continue
+                file_hash = compute_file_hash(file_path)
+                if use_cache:
+                    cached_analysis = self._get_cached_analysis(file_hash)
+                    self._record_cache_result(cached_analysis is not None)
+                    if cached_analysis:
+                        cached_analysis['file_path'] = str(file_path)
+                        self.analyzed_content.append(cached_analysis)
+                        results.append((media_path, cached_analysis, None))
+                        continue
+                hashes, entry, owner = None, None, True
+                if use_cache:
+                    hashes, entry, owner = self._claim_near_duplicate(file_path)
+                    if not owner:
+                        near_duplicates.append((media_path, file_path, file_hash, hashes, entry))
+                        continue
+                try:
+                    image, upload_stats = prepare_image_for_upload(
+                        file_path, self.upload_max_edge, self.upload_quality
+                    )
+                except Exception:
+                    if entry:
+                        entry.resolve(None)
+                    raise
+                batch.append((media_path, file_path, file_hash, image, upload_stats, hashes, entry))
+            except Exception as e:
+                results.append((media_path, None, e))
+
+        analyses = {}
+        if len(batch) > 1:
+            contents = [self._build_batch_prompt(len(batch))]
+            for number, (_, _, _, image, _, _, _) in enumerate(batch, 1):
+                contents += [f"Image {number}:", image]
+            generation_config = None
+            if self.structured_output:
+                generation_config = genai.GenerationConfig(
+                    response_mime_type='application/json',
+                    response_schema=BATCH_RESPONSE_SCHEMA
+                )
+            try:
+                response, usage_id = self._generate_content(
+                    contents,
+                    'batch',
+                    media_count=len(batch),
+                    estimated_tokens=GEMINI_ESTIMATED_TOKENS * len(batch),
+                    generation_config=generation_config
+                )
+                analyses = self._split_batch_response(response.text, len(batch))
+                for analysis in analyses.values():
+                    analysis['usage_id'] = usage_id
+            except Exception as e:
+                print(f"Batched analysis failed, falling back to single requests: {e}")
+
+        for number, (media_path, file_path, file_hash, image, upload_stats, hashes, entry) in enumerate(batch, 1):
+            analysis = None
+            try:
+                if number in analyses:
+                    analysis = analyses[number]
+                    if hashes:
+                        analysis['phash'], analysis['dhash'] = (hash_to_hex(h) for h in hashes)
+                    analysis = self._store_analysis(analysis, file_path, False, file_hash, upload_stats)
+                else:
+                    # Cache was already checked above
+                    analysis = self._analyze_prepared(file_path, False, file_hash, image, upload_stats, hashes)
+                results.append((media_path, analysis, None))
+            except Exception as e:
+                results.append((media_path, None, e))
+            finally:
+                if entry:
+                    entry.resolve(analysis['id'] if analysis else None)
+
+        for media_path, file_path, file_hash, hashes, entry in near_duplicates:
+            try:
+                analysis = self._reuse_near_duplicate(entry, file_path, file_hash, hashes)
+                if analysis is None:
+                    # The near-duplicate's analysis failed, so analyze this image instead
+                    image, upload_stats = prepare_image_for_upload(
+                        file_path, self.upload_max_edge, self.upload_quality
+                    )
+                    analysis = self._analyze_prepared(file_path, False, file_hash, image, upload_stats, hashes)
+                results.append((media_path, analysis, None))
+            except Exception as e:
+                results.append((media_path, None, e))
+        return results
+
+    def _analyze_group(self, media_paths):
+        """Analyze one unit of work for analyze_many."""
+        if len(media_paths) > 1:
+            return self.analyze_batch(media_paths)
+        media_path = media_paths[0]
+        try:
+            return [(media_path, self.analyze_media(media_path), None)]
         except Exception as e:
-            print(f"Error analyzing media: {e}")
-            raise
+            return [(media_path, None, e)]
+
+    def analyze_many(self, media_paths, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                     batch_size=DEFAULT_BATCH_SIZE):
+        """Analyze many media files concurrently, yielding results as they finish.
+
+        At most ``max_concurrency`` Gemini requests run at once on a thread
+        pool, and ``media_paths`` is consumed lazily so large batches are never
+        queued up front. With ``batch_size`` above 1, images are grouped into
+        multi-image requests through ``analyze_batch``. Each result is yielded
+        as ``(media_path, analysis, error)`` where exactly one of ``analysis``
+        and ``error`` is set, so a failing file never stops the rest of the
+        batch. Every successful analysis is saved through ``_save_to_database``.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+
+        pending_paths = (str(media_path) for media_path in media_paths)
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            in_flight = {}
+
+            def submit_next():
+                group = list(islice(pending_paths, batch_size))
+                if not group:
+                    return False
+                future = executor.submit(self._analyze_group, group)
+                in_flight[future] = group
+                return True
+
+            # Fill the pool up to the concurrency limit
+            while len(in_flight) < max_concurrency and submit_next():
+                pass
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group = in_flight.pop(future)
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        results = [(media_path, None, e) for media_path in group]
+                    yield from results
+                    # Keep the pool topped up as each request finishes
+                    submit_next()
+
+    def _parse_structured_analysis(self, response_text):
+        """Parse and validate a JSON response produced with ANALYSIS_RESPONSE_SCHEMA.
+
+        Raises ValueError if the response is not valid JSON or any score or
+        field is missing, so callers can fall back to _parse_analysis.
+        """
+        try:
+            data = json.loads(response_text)
+        except (TypeError, json.JSONDecodeError) as e:
+            raise ValueError(f"response is not valid JSON: {e}")
+        return self._structured_to_analysis(data)
+
+    def _structured_to_analysis(self, data):
+        """Validate a decoded structured response and build the analysis dictionary."""
+        if not isinstance(data, dict) or not isinstance(data.get('scores'), dict):
+            raise ValueError("response has no scores object")
+
+        scores = {}
+        for category in self.categories:
+            score = data['scores'].get(CATEGORY_KEYS[category])
+            if isinstance(score, bool) or not isinstance(score, int) or not 1 <= score <= 10:
+                raise ValueError(f"invalid score for {category}: {score!r}")
+            scores[category] = score
+
+        for field in STRUCTURED_TEXT_FIELDS:
+            if not isinstance(data.get(field), str):
+                raise ValueError(f"missing field: {field}")
+        hashtags = data.get('hashtags')
+        if not isinstance(hashtags, list) or not all(isinstance(tag, str) for tag in hashtags):
+            raise ValueError("hashtags must be a list of strings")
+
+        return {
+            'scores': scores,
+            'total_score': sum(scores.values()),
+            'caption': data['caption'].strip(),
+            'hashtags': self._extract_hashtags(' '.join(
+                tag if tag.startswith('#') else f"#{tag}" for tag in hashtags
+            )),
+            'engagement_tips': data['engagement_tips'].strip(),
+            'key_strengths': data['key_strengths'].strip(),
+            'improvement_suggestions': data['improvement_suggestions'].strip(),
+            'timestamp': datetime.now(pytz.UTC),
+        }
 
     def _parse_analysis(self, response_text):
-        """Parse the Gemini response into structured data."""
+        """Parse a free-text Gemini response into structured data.
+
+        This is the fallback used when structured output is disabled or a
+        structured response fails validation.
+        """
         try:
             # Extract scores using simple parsing
             scores = {}
@@ -518,11 +1251,52 @@ class CatContentAnalyzer:
 
         return schedule
 
+    def get_media_probe(self, content):
+        """Return the stored media probe (MEDIA_PROBE_COLUMNS) for a piece of content.
+
+        Uses the values already on ``content`` or its content_analysis row.
+        Analyses saved before probing was added are probed once here and
+        their row is backfilled.
+        """
+        if content.get('mime_type'):
+            return {column: content.get(column) for column in MEDIA_PROBE_COLUMNS}
+
+        analysis_id = content.get('id')
+        if analysis_id is not None:
+            with get_database().read() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                SELECT {', '.join(MEDIA_PROBE_COLUMNS)} FROM content_analysis WHERE id = ?
+                ''', (analysis_id,))
+                row = cursor.fetchone()
+            if row and row[0]:
+                probe = dict(zip(MEDIA_PROBE_COLUMNS, row))
+                content.update(probe)
+                return probe
+
+        probe = probe_media(content['file_path'])
+        content.update(probe)
+        if analysis_id is not None:
+            with get_database().write() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                UPDATE content_analysis
+                SET {', '.join(f'{column} = ?' for column in MEDIA_PROBE_COLUMNS)}
+                WHERE id = ?
+                ''', (*(probe[column] for column in MEDIA_PROBE_COLUMNS), analysis_id))
+                conn.commit()
+        return probe
+
     def post_to_social_media(self, content, platforms=None):
         """Post content to specified social media platforms."""
         if platforms is None:
             platforms = ['instagram', 'twitter', 'facebook', 'tiktok']
 
+        try:
+            probe = self.get_media_probe(content)
+        except OSError as e:
+            st.warning(f"Could not read media details: {e}")
+            probe = dict.fromkeys(MEDIA_PROBE_COLUMNS)
         results = {}
         for platform in platforms:
             success = False
@@ -535,25 +1309,18 @@ class CatContentAnalyzer:
                         continue
                     
                     # Check video file format
-                    path = Path(content['file_path'])
-                    if path.suffix.lower() not in ['.mp4', '.mov', '.avi']:
+                    if not (probe['mime_type'] or '').startswith('video/'):
                         st.error("TikTok only accepts video files (.mp4, .mov, .avi)")
                         results[platform] = False
                         continue
                     
                     # Check video duration (TikTok limits)
-                    try:
-                        from moviepy.editor import VideoFileClip
-                        video = VideoFileClip(str(path))
-                        duration = video.duration
-                        video.close()
-                        
-                        if duration > 600:  # 10 minutes max
-                            st.error("TikTok videos must be 10 minutes or shorter")
-                            results[platform] = False
-                            continue
-                    except Exception as e:
-                        st.warning(f"Could not verify video duration: {e}")
+                    if probe['duration'] is None:
+                        st.warning("Could not verify video duration")
+                    elif probe['duration'] > TIKTOK_MAX_DURATION_SECONDS:
+                        st.error("TikTok videos must be 10 minutes or shorter")
+                        results[platform] = False
+                        continue
                     
                     success = self.social_media.post_to_tiktok(
                         content['file_path'],
@@ -565,13 +1332,15 @@ class CatContentAnalyzer:
                     success = self.social_media.post_to_instagram(
                         content['file_path'],
                         content['caption'],
-                        content['hashtags']
+                        content['hashtags'],
+                        mime_type=probe['mime_type']
                     )
                 elif platform == 'twitter':
                     success = self.social_media.post_to_twitter(
                         content['file_path'],
                         content['caption'],
-                        content['hashtags']
+                        content['hashtags'],
+                        mime_type=probe['mime_type']
                     )
                 elif platform == 'facebook':
                     success = self.social_media.post_to_facebook(
@@ -598,37 +1367,216 @@ class CatContentAnalyzer:
                 'generated_at': datetime.now(pytz.UTC).isoformat()
             }, f, indent=2, default=str)
 
+    def import_analysis(self, input_path='content_analysis.json'):
+        """Import analyses written by export_analysis into the database.
+
+        Analyses whose file hash is already stored are skipped. Returns the
+        number of analyses imported.
+        """
+        with open(input_path) as f:
+            analyses = json.load(f)['analyzed_content']
+        with get_database().read() as conn:
+            stored_hashes = {row[0] for row in conn.execute('''
+            SELECT file_hash FROM content_analysis WHERE file_hash IS NOT NULL
+            ''')}
+        analyses = [
+            analysis for analysis in analyses
+            if not analysis.get('file_hash') or analysis['file_hash'] not in stored_hashes
+        ]
+        self.save_many(analyses)
+        return len(analyses)
+
     def __del__(self):
         """Cleanup method - no need to close connection as we're using context managers."""
         pass
 
-def main():
-    analyzer = CatContentAnalyzer()
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Cat Content Analyzer for Instagram")
+    parser.add_argument(
+        '--batch',
+        metavar='MEDIA_DIR',
+        help="Analyze every supported file in MEDIA_DIR non-interactively and exit"
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help=f"Maximum number of Gemini requests in flight (default: {DEFAULT_MAX_CONCURRENCY})"
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Number of images sent to Gemini in a single request (default: {DEFAULT_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        '--frame-sampling',
+        choices=VIDEO_SAMPLING_MODES,
+        default=VIDEO_SAMPLING_MODE,
+        help="How video frames are picked for the contact sheet: evenly spaced ('uniform') "
+             f"or at the largest scene changes ('scene') (default: {VIDEO_SAMPLING_MODE})"
+    )
+    parser.add_argument(
+        '--worker',
+        action='store_true',
+        help="Analyze jobs already in the queue until it is empty, without scanning; "
+             "run several at once to drain the queue in parallel"
+    )
+    parser.add_argument(
+        '--rescan',
+        action='store_true',
+        help="Re-check every file instead of skipping files unchanged since they were analyzed"
+    )
+    parser.add_argument(
+        '--import',
+        dest='import_path',
+        metavar='JSON_FILE',
+        help="Import analyses exported to JSON_FILE (such as content_analysis.json) into the database, then exit"
+    )
+    parser.add_argument(
+        '--invalidate-cache',
+        action='store_true',
+        help="Mark all stored analyses as stale so they are re-analyzed, then exit"
+    )
+    return parser.parse_args(argv)
+
+def make_scanner(rescan=False):
+    """Create a recursive media scanner that skips files already analyzed.
+
+    With ``rescan`` the persistent scan index is cleared first, so every file
+    is hashed again (unchanged content is still served from the analysis cache).
+    """
+    index = ScanIndex(ANALYSIS_VERSION)
+    if rescan:
+        index.clear()
+    return MediaScanner(index, IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)
+
+def start_scan(queue, scanner, media_dir):
+    """Queue new and changed files under media_dir from a background thread.
+
+    Returns the thread. Pass it to run_analysis as ``scanning`` so analysis
+    starts while the directory is still being walked.
+    """
+    def scan():
+        try:
+            queue.enqueue_many(scanner.scan(media_dir))
+        except Exception as e:
+            print(f"Error scanning {media_dir}: {e}")
+
+    thread = threading.Thread(target=scan, name='media-scan', daemon=True)
+    thread.start()
+    return thread
+
+def run_analysis(analyzer, queue, max_concurrency, batch_size=DEFAULT_BATCH_SIZE, scanner=None, scanning=None):
+    """Drain the analysis job queue concurrently and print each result as it finishes.
+
+    Jobs are claimed one at a time as ``analyze_many`` asks for more work and
+    stay leased to this process while it runs, so other workers can drain
+    the same queue and an interrupted run's jobs are picked up again. While
+    the ``scanning`` thread (see start_scan) is alive, an empty queue is
+    polled for newly scanned files instead of ending the run. Successful
+    files are recorded in ``scanner``'s index so later scans skip them.
+    Returns the number of files processed.
+    """
+    worker_id = make_worker_id()
+    job_ids = {}
+
+    def claimed_paths():
+        while True:
+            scan_done = scanning is None or not scanning.is_alive()
+            for job_id, file_path in queue.iter_claims(worker_id):
+                job_ids[file_path] = job_id
+                yield file_path
+            if scan_done:
+                return
+            time.sleep(SCAN_POLL_SECONDS)
+
+    analyzed = failed = 0
+    with queue.leases_kept(worker_id):
+        for file_path, analysis, error in analyzer.analyze_many(claimed_paths(), max_concurrency, batch_size):
+            job_id = job_ids.pop(file_path)
+            if error is None:
+                analyzed += 1
+                queue.complete(job_id, analysis.get('id'))
+                if scanner:
+                    scanner.mark_analyzed(file_path, analysis.get('file_hash'))
+                print(f"✅ {Path(file_path).name}: Total Score {analysis['total_score']}/50")
+            else:
+                failed += 1
+                queue.fail(job_id, error, worker_id, retry=not isinstance(error, FileNotFoundError))
+                print(f"❌ Error analyzing {Path(file_path).name}: {error}")
+    stats = analyzer.cache_stats()
+    print(f"\nAnalyzed {analyzed} files ({failed} failed)")
+    waiting = queue.counts().get('queued', 0)
+    if waiting:
+        print(f"{waiting} jobs are still queued (waiting to be retried or claimed by other workers)")
+    if scanner:
+        print(f"Skipped {len(scanner.skipped)} unchanged files")
+    print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['near_duplicates']} near-duplicates reused")
+    usage = analyzer.get_usage_summary()
+    print(f"Gemini: {usage['prompt_tokens_per_analysis']:.0f} prompt / "
+          f"{usage['output_tokens_per_analysis']:.0f} output tokens per analysis, "
+          f"{usage['cached_token_share']:.0%} of prompt tokens cached, "
+          f"{usage['avg_latency_ms']:.0f} ms average latency")
+    return analyzed + failed
+
+def main(argv=None):
+    args = parse_args(argv)
+    analyzer = CatContentAnalyzer(video_sampling=args.frame_sampling)
     
     print("🐱 Cat Content Analyzer for Instagram")
     print("=====================================")
     
+    if args.invalidate_cache:
+        invalidated = analyzer.invalidate_cache()
+        make_scanner(rescan=True)
+        print(f"Invalidated {invalidated} cached analyses.")
+        return
+    
+    if args.import_path:
+        imported = analyzer.import_analysis(args.import_path)
+        print(f"Imported {imported} analyses from {args.import_path}.")
+        return
+    
+    queue = AnalysisJobQueue()
+    
+    if args.worker:
+        print(f"\nAnalyzing queued jobs, up to {args.max_concurrency} at a time...")
+        run_analysis(analyzer, queue, args.max_concurrency, args.batch_size)
+        return
+    
+    scanner = make_scanner(args.rescan)
+    
+    if args.batch:
+        print(f"\nScanning {args.batch} for new or changed media. Analyzing up to {args.max_concurrency} at a time...")
+        scanning = start_scan(queue, scanner, args.batch)
+        processed = run_analysis(analyzer, queue, args.max_concurrency, args.batch_size, scanner, scanning)
+        if not processed and not scanner.skipped:
+            print("No supported media files found in the specified directory.")
+            return
+        
+        analyzer.export_analysis()
+        print("\n✅ Analysis exported to content_analysis.json")
+        return
+    
     # Get media files from user
     media_dir = input("Enter the directory path containing your cat media files: ")
-    media_files = [
-        f for f in Path(media_dir).glob("*")
-        if f.suffix.lower() in ['.jpg', '.jpeg', '.png', '.mp4', '.mov', '.avi']
-    ]
     
-    if not media_files:
+    print(f"\nScanning {media_dir} for new or changed media. Starting analysis...")
+    
+    # Queue new and changed files while analyzing them (and any jobs left by
+    # an interrupted run) concurrently
+    scanning = start_scan(queue, scanner, media_dir)
+    processed = run_analysis(analyzer, queue, args.max_concurrency, args.batch_size, scanner, scanning)
+    
+    if not processed and not scanner.skipped:
         print("No supported media files found in the specified directory.")
         return
     
-    print(f"\nFound {len(media_files)} media files. Starting analysis...")
-    
-    # Analyze each file
-    for file_path in media_files:
-        print(f"\nAnalyzing: {file_path.name}")
-        try:
-            analysis = analyzer.analyze_media(str(file_path))
-            print(f"Total Score: {analysis['total_score']}/50")
-        except Exception as e:
-            print(f"Error analyzing {file_path.name}: {e}")
+    # Unchanged files were skipped by the scan; schedule them from their stored analyses
+    analyzer.load_cached_analyses(scanner.skipped)
     
     # Generate and display posting schedule
     schedule = analyzer.generate_posting_schedule()
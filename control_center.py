@@ -7,9 +7,13 @@ import pytz
 from streamlit_option_menu import option_menu
 import pandas as pd
 from cat_content_analyzer import CatContentAnalyzer
-from PIL import Image
+from media_store import MediaStore, blob_hash
+from job_queue import AnalysisJobQueue, make_worker_id
+from db import get_database, count_queries, epoch_ms, from_epoch_ms
+from repository import ContentRepository, CONTENT_PAGE_SIZE
+from migrations import CATEGORY_SCORE_COLUMNS
+from thumbnail_cache import get_thumbnail_cache, DISPLAY_SIZE, GRID_SIZE, PREVIEW_SIZE
 import io
-import sqlite3
 from custom_components import (
     custom_menu_button,
     custom_scrollable_region,
@@ -414,14 +418,72 @@ if 'pending_posts' not in st.session_state:
     st.session_state.pending_posts = []
 if 'posted_content' not in st.session_state:
     st.session_state.posted_content = []
+if 'stored_uploads' not in st.session_state:
+    st.session_state.stored_uploads = {}
 
-# Create temp directory if it doesn't exist
-temp_dir = Path("temp")
-if not temp_dir.exists():
-    temp_dir.mkdir(parents=True, exist_ok=True)
+# Pooled connections to cat_content.db
+database = get_database()
 
-def load_and_display_media(file_path):
-    """Load and display media file."""
+# Batched posting history and engagement metrics lookups for whole pages
+repository = ContentRepository(database)
+
+# Show the number of SQL statements each page render runs (set to 1 while
+# checking that a page's queries do not grow with the number of items shown)
+SHOW_QUERY_COUNT = os.getenv('CONTROL_CENTER_SHOW_QUERY_COUNT', '0') == '1'
+
+# Uploaded media is kept once per content hash in the media store
+media_store = MediaStore()
+
+# Analyses started here are recorded as leased jobs, so a worker finishes
+# them if the session dies mid-analysis
+job_queue = AnalysisJobQueue()
+
+def store_upload(file):
+    """Stream an uploaded file into the media store and return ``(media_path, file_hash)``.
+
+    Streamlit reruns the script on every widget interaction, so the result is
+    kept in session state per upload and the file is only streamed and
+    hashed again if its stored copy has been removed.
+    """
+    key = getattr(file, 'file_id', None) or (file.name, file.size)
+    stored = st.session_state.stored_uploads.get(key)
+    if stored is None or not stored[0].exists():
+        file.seek(0)
+        stored = media_store.add_stream(file, Path(file.name).suffix)
+        st.session_state.stored_uploads[key] = stored
+    return stored
+
+def display_video_preview(file_path, size=DISPLAY_SIZE, file_hash=None, key=None):
+    """Show a video's poster frame, loading a low-bitrate preview clip on demand.
+
+    The poster and the clip are keyed on the stored file_hash, or on the blob
+    name for videos in the media store, so the video is not read to hash it.
+    """
+    file_hash = file_hash or blob_hash(file_path, media_store.root)
+    cache = get_thumbnail_cache()
+    try:
+        poster_path = cache.get(file_path, size, file_hash, kind='poster')
+    except Exception as e:
+        st.warning(f"Could not create a preview for {file_path.name}: {str(e)}")
+        return st.video(str(file_path))
+    
+    if not st.toggle("▶️ Play preview", key=f"play_preview_{key or file_path}_{size[0]}x{size[1]}"):
+        return st.image(str(poster_path), use_column_width=True)
+    
+    try:
+        with st.spinner("Preparing preview..."):
+            preview_path = cache.get(file_path, PREVIEW_SIZE, file_hash, kind='preview')
+    except Exception as e:
+        st.warning(f"Could not create a preview clip, playing the original: {str(e)}")
+        return st.video(str(file_path))
+    return st.video(str(preview_path))
+
+def load_and_display_media(file_path, size=DISPLAY_SIZE, file_hash=None, key=None):
+    """Load and display media file, serving images from the thumbnail cache.
+    
+    Videos are shown as a poster frame; key distinguishes the play toggles
+    of the same video shown more than once on a page.
+    """
     try:
         file_path = Path(file_path)
         if not file_path.exists():
@@ -429,168 +491,90 @@ def load_and_display_media(file_path):
             return
         
         if file_path.suffix.lower() in ['.mp4', '.mov', '.avi']:
-            return st.video(str(file_path))
-        else:
-            # Open and verify the image
-            try:
-                # First try to open and validate the image
-                with Image.open(file_path) as img:
-                    # Verify the image
-                    img.verify()
-                
-                # Reopen the image for processing (verify closes the file)
-                img = Image.open(file_path)
-                
-                # Convert to RGB if necessary before any processing
-                if img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Get and validate image dimensions
-                width, height = img.size
-                if width <= 0 or height <= 0:
-                    st.error(f"Invalid image dimensions: {width}x{height}")
-                    return
-                
-                # Calculate new dimensions while preserving aspect ratio
-                max_width = 800  # Maximum display width
-                max_height = 1200  # Maximum display height
-                
-                # Calculate scale factors for both width and height
-                width_scale = max_width / width if width > max_width else 1
-                height_scale = max_height / height if height > max_height else 1
-                
-                # Use the smaller scale factor to ensure image fits within bounds
-                scale = min(width_scale, height_scale)
-                
-                # Calculate new dimensions
-                if scale < 1:  # Only resize if image is too large
-                    new_width = max(1, int(width * scale))
-                    new_height = max(1, int(height * scale))
-                    
-                    try:
-                        # Resize image
-                        img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    except Exception as e:
-                        st.warning(f"Error during resize, displaying original image: {str(e)}")
-                
-                # Display the image
-                try:
-                    return st.image(img, use_column_width=True)
-                except Exception as e:
-                    # If streamlit display fails, try converting to bytes
-                    try:
-                        import io
-                        img_byte_arr = io.BytesIO()
-                        img.save(img_byte_arr, format='JPEG')
-                        img_byte_arr = img_byte_arr.getvalue()
-                        return st.image(img_byte_arr, use_column_width=True)
-                    except Exception as e2:
-                        st.error(f"Failed to display image: {str(e2)}")
-                        return
-                        
-            except Exception as e:
-                st.error(f"Error processing image {file_path.name}: {str(e)}")
-                # Try to display the original file as a last resort
-                try:
-                    return st.image(str(file_path), use_column_width=True)
-                except:
-                    st.error("Failed to display image in any format")
-                    return
+            return display_video_preview(file_path, size, file_hash, key)
+        
+        try:
+            thumbnail_path = get_thumbnail_cache().get(file_path, size, file_hash)
+        except Exception as e:
+            st.error(f"Error processing image {file_path.name}: {str(e)}")
+            return
+        return st.image(str(thumbnail_path), use_column_width=True)
     except Exception as e:
         st.error(f"Error loading media: {str(e)}")
         return
 
+def prefetch_previews(file_paths, size=GRID_SIZE, file_hashes=None):
+    """Start rendering image thumbnails and video posters for a grid in parallel before it is drawn.
+
+    Pass the stored ``file_hashes`` (one per path) so originals are not read to hash them.
+    """
+    file_paths = list(file_paths)
+    file_hashes = list(file_hashes) if file_hashes is not None else [None] * len(file_paths)
+    media = [(Path(path), file_hash) for path, file_hash in zip(file_paths, file_hashes)
+             if path and Path(path).exists()]
+    videos = [(path, file_hash) for path, file_hash in media if path.suffix.lower() in ['.mp4', '.mov', '.avi']]
+    images = [(path, file_hash) for path, file_hash in media if path.suffix.lower() not in ['.mp4', '.mov', '.avi']]
+    cache = get_thumbnail_cache()
+    cache.prefetch([path for path, _ in images], size, file_hashes=[file_hash for _, file_hash in images])
+    cache.prefetch([path for path, _ in videos], size, kind='poster',
+                   file_hashes=[file_hash for _, file_hash in videos])
+
 def analyze_media(uploaded_files):
     """Analyze uploaded media files."""
     results = []
+    analyzer = st.session_state.analyzer
+    worker_id = make_worker_id()
     
-    # Connect to database
-    conn = sqlite3.connect('cat_content.db')
-    cursor = conn.cursor()
-    
-    for file in uploaded_files:
-        # Save the file temporarily
-        temp_path = Path("temp") / f"temp_{file.name}"
-        temp_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        try:
-            # Calculate file hash for duplicate checking
-            file_content = file.getvalue()
-            import hashlib
-            file_hash = hashlib.md5(file_content).hexdigest()
-            
-            # Check if file was already analyzed using both filename and hash
-            cursor.execute("""
-                SELECT ca.*, cs.category, cs.score 
-                FROM content_analysis ca
-                LEFT JOIN category_scores cs ON ca.id = cs.analysis_id
-                WHERE (ca.original_filename = ? OR ca.file_hash = ?)
-                GROUP BY ca.id
-            """, (file.name, file_hash))
-            existing_analysis = cursor.fetchone()
-            
-            if existing_analysis:
-                # Get the full analysis from database
-                analysis_id = existing_analysis[0]
-                cursor.execute("""
-                    SELECT category, score 
-                    FROM category_scores 
-                    WHERE analysis_id = ?
-                """, (analysis_id,))
-                scores = {row[0]: row[1] for row in cursor.fetchall()}
-                
-                # Reconstruct analysis dictionary
-                analysis = {
-                    'id': analysis_id,
-                    'file_path': str(temp_path),
-                    'original_filename': existing_analysis[2],
-                    'media_type': existing_analysis[3],
-                    'total_score': existing_analysis[4],
-                    'caption': existing_analysis[5],
-                    'hashtags': existing_analysis[6],
-                    'engagement_tips': existing_analysis[7],
-                    'key_strengths': existing_analysis[8],
-                    'improvement_suggestions': existing_analysis[9],
-                    'timestamp': existing_analysis[10],
-                    'file_hash': existing_analysis[11] if len(existing_analysis) > 11 else file_hash,
-                    'scores': scores
-                }
-                
-                # Save the file for display
-                with open(temp_path, "wb") as f:
-                    f.write(file_content)
+    with job_queue.leases_kept(worker_id):
+        for file in uploaded_files:
+            try:
+                # Stream the upload into the media store once, hashing it for
+                # duplicate checking in the same pass so large videos are never
+                # copied into memory
+                media_path, file_hash = store_upload(file)
                 
-                st.info(f"Found existing analysis for {file.name} - Skipping reanalysis")
-            else:
-                # Save the file for new analysis
-                with open(temp_path, "wb") as f:
-                    f.write(file_content)
+                # Analyze the file, reusing the hash computed while saving it.
+                # Content already analyzed at the current ANALYSIS_VERSION is
+                # served from the analyzer's cache without calling Gemini.
+                cache_hits = analyzer.cache_hits
+                job_id = job_queue.start(media_path, worker_id)
+                try:
+                    analysis = analyzer.analyze_media(
+                        str(media_path), file_hash=file_hash, original_filename=file.name
+                    )
+                except Exception as e:
+                    if job_id:
+                        job_queue.fail(job_id, e, worker_id)
+                    raise
+                if job_id:
+                    job_queue.complete(job_id, analysis.get('id'))
                 
-                # Analyze the file
-                analysis = st.session_state.analyzer.analyze_media(str(temp_path))
-                analysis['original_filename'] = file.name
-                analysis['file_path'] = str(temp_path)
-                analysis['file_hash'] = file_hash
+                if analyzer.cache_hits > cache_hits:
+                    # Point analyses whose media went missing at the stored
+                    # copy of the same content
+                    with database.write() as conn:
+                        stored = conn.execute("""
+                            SELECT file_path FROM content_analysis WHERE id = ?
+                        """, (analysis['id'],)).fetchone()
+                        if stored and not (stored[0] and Path(stored[0]).exists()):
+                            conn.execute("""
+                                UPDATE content_analysis
+                                SET file_path = ?
+                                WHERE id = ?
+                            """, (str(media_path), analysis['id']))
+                    st.info(f"Found existing analysis for {file.name} - Skipping reanalysis")
+                elif analysis.get('near_duplicate_of'):
+                    st.info(f"{file.name} is a near-duplicate of an analyzed photo - Reused its analysis")
+                else:
+                    st.success(f"New analysis completed for {file.name}")
                 
-                # Store the file hash in the database for future duplicate checking
-                cursor.execute("""
-                    UPDATE content_analysis 
-                    SET file_hash = ? 
-                    WHERE id = ?
-                """, (file_hash, analysis.get('id')))
-                conn.commit()
+                results.append(analysis)
+                st.session_state.analyzed_content.append(analysis)
                 
-                st.success(f"New analysis completed for {file.name}")
-            
-            results.append(analysis)
-            st.session_state.analyzed_content.append(analysis)
-            
-        except Exception as e:
-            st.error(f"Error analyzing {file.name}: {e}")
-            if temp_path.exists():
-                temp_path.unlink()
+            except Exception as e:
+                # Stored media that ends up unreferenced is removed by media_store.py --gc
+                st.error(f"Error analyzing {file.name}: {e}")
     
-    conn.close()
     return results
 
 def display_analysis_results(analysis):
@@ -599,7 +583,7 @@ def display_analysis_results(analysis):
     
     with col1:
         st.markdown(f"### Media Info")
-        load_and_display_media(analysis['file_path'])
+        load_and_display_media(analysis['file_path'], file_hash=analysis.get('file_hash'))
         st.markdown(f"**File:** {analysis['original_filename']}")
         st.markdown(f"**Type:** {analysis['media_type']}")
     
@@ -634,22 +618,18 @@ def display_analysis_results(analysis):
         with st.expander("Improvement Suggestions"):
             custom_scrollable_region(analysis['improvement_suggestions'], max_height="150px", label="Improvement suggestions", key=f"improvements_{analysis['file_path']}")
 
-def schedule_post(analysis):
-    """Add post to pending schedule."""
-    # Connect to database to check posting history
-    conn = sqlite3.connect('cat_content.db')
-    cursor = conn.cursor()
-    
+def schedule_post(analysis, posting_history=None):
+    """Add post to pending schedule.
+
+    ``posting_history`` is the analysis's rows from
+    ``ContentRepository.posting_history_by_analysis``; callers rendering
+    several analyses fetch it for all of them at once.
+    """
     # Check if this content was already posted
     if 'id' in analysis:
-        cursor.execute("""
-            SELECT platform, status, posted_at 
-            FROM posting_history 
-            WHERE analysis_id = ?
-            ORDER BY posted_at DESC
-        """, (analysis['id'],))
-        posting_history = cursor.fetchall()
-        
+        if posting_history is None:
+            posting_history = repository.posting_history_by_analysis([analysis['id']])[analysis['id']]
+
         if posting_history:
             st.info("Previous posting history:")
             history_df = pd.DataFrame(
@@ -695,17 +675,15 @@ def schedule_post(analysis):
         
         # Record scheduling in database
         if 'id' in analysis:
-            for platform in platforms:
-                cursor.execute("""
-                    INSERT INTO posting_history 
-                    (analysis_id, platform, status, posted_at) 
-                    VALUES (?, ?, ?, ?)
-                """, (analysis['id'], platform, 'scheduled', post_datetime))
-            conn.commit()
-        
+            with database.write() as conn:
+                posted_at_ms = epoch_ms(post_datetime)
+                conn.executemany("""
+                    INSERT INTO posting_history
+                    (analysis_id, platform, status, posted_at_ms, posted_at)
+                    VALUES (?, ?, ?, ?, datetime(? / 1000, 'unixepoch'))
+                """, [(analysis['id'], platform, 'scheduled', posted_at_ms, posted_at_ms) for platform in platforms])
+
         st.success("Content scheduled!")
-    
-    conn.close()
 
 def manage_pending_posts():
     """Manage and approve pending posts."""
@@ -713,17 +691,22 @@ def manage_pending_posts():
         st.info("No pending posts.")
         return
     
-    # Connect to database
-    conn = sqlite3.connect('cat_content.db')
-    cursor = conn.cursor()
-    
     st.subheader("Pending Posts")
+    prefetch_previews(
+        [post['analysis']['file_path'] for post in st.session_state.pending_posts], DISPLAY_SIZE,
+        [post['analysis'].get('file_hash') for post in st.session_state.pending_posts]
+    )
+    posting_history = repository.posting_history_by_analysis(
+        post['analysis'].get('id') for post in st.session_state.pending_posts
+    )
     for i, post in enumerate(st.session_state.pending_posts):
         with st.expander(f"Content {i+1}: {post['analysis']['original_filename']}"):
             col1, col2 = st.columns([2, 3])
             
             with col1:
-                load_and_display_media(post['analysis']['file_path'])
+                load_and_display_media(
+                    post['analysis']['file_path'], file_hash=post['analysis'].get('file_hash'), key=f"pending_{i}"
+                )
             
             with col2:
                 st.write("Scheduled for:", post['scheduled_time'])
@@ -734,13 +717,7 @@ def manage_pending_posts():
                 
                 # Show posting history if available
                 if 'id' in post['analysis']:
-                    cursor.execute("""
-                        SELECT platform, status, posted_at 
-                        FROM posting_history 
-                        WHERE analysis_id = ?
-                        ORDER BY posted_at DESC
-                    """, (post['analysis']['id'],))
-                    history = cursor.fetchall()
+                    history = posting_history.get(post['analysis']['id'], [])
                     if history:
                         st.write("Posting History:")
                         history_df = pd.DataFrame(
@@ -791,14 +768,14 @@ def manage_pending_posts():
                             
                             # Update database for TikTok
                             if 'id' in post['analysis']:
-                                cursor.execute("""
-                                    UPDATE posting_history 
-                                    SET status = 'success', posted_at = ? 
-                                    WHERE analysis_id = ? AND platform = 'tiktok'
-                                """, (datetime.now(pytz.UTC), post['analysis']['id']))
-                                conn.commit()
-    
-    conn.close()
+                                with database.write() as conn:
+                                    posted_at_ms = epoch_ms()
+                                    conn.execute("""
+                                        UPDATE posting_history
+                                        SET status = 'success', posted_at_ms = ?,
+                                            posted_at = datetime(? / 1000, 'unixepoch')
+                                        WHERE analysis_id = ? AND platform = 'tiktok'
+                                    """, (posted_at_ms, posted_at_ms, post['analysis']['id']))
 
 def view_analytics():
     """View analytics and posting history."""
@@ -1072,7 +1049,7 @@ def view_database():
     st.header("Database Management")
     
     # Connect to database
-    conn = sqlite3.connect('cat_content.db')
+    conn = database.connect(readonly=True)
     
     # Sidebar for table selection
     tables = ['content_analysis', 'category_scores', 'posting_history']
@@ -1157,11 +1134,16 @@ def view_database():
     
     with maintenance_col1:
         if st.button("Vacuum Database"):
+            # VACUUM writes, and cannot run inside a transaction, so it gets a
+            # writer connection of its own instead of db.write()
+            vacuum_conn = database.connect()
             try:
-                cursor.execute("VACUUM")
+                vacuum_conn.execute("VACUUM")
                 st.success("Database optimized successfully")
             except Exception as e:
                 st.error(f"Error optimizing database: {e}")
+            finally:
+                vacuum_conn.close()
     
     with maintenance_col2:
         if st.button("Export Full Database"):
@@ -1190,14 +1172,40 @@ def view_database():
     # Close connection
     conn.close()
 
+def category_filter_controls(key, default_sort):
+    """Render per-category minimum score and sort controls for a content list.
+
+    Returns ``(conditions, params, order_by)`` for a query over
+    ``content_analysis ca``: SQL conditions to AND into its WHERE clause,
+    their parameters, and its ORDER BY expression. The category columns are
+    indexed, so the filtering and sorting happen in SQLite.
+    """
+    sort_options = {
+        'Total score': 'ca.total_score DESC',
+        'Newest': 'ca.created_at DESC',
+        **{category: f'ca.{column} DESC' for category, column in CATEGORY_SCORE_COLUMNS.items()}
+    }
+    conditions, params = [], []
+    with st.expander("Category filters"):
+        cols = st.columns(len(CATEGORY_SCORE_COLUMNS))
+        for col, (category, column) in zip(cols, CATEGORY_SCORE_COLUMNS.items()):
+            with col:
+                minimum = st.number_input(f"Min {category}", 0, 10, 0, key=f"{key}_min_{column}")
+            if minimum:
+                conditions.append(f"ca.{column} >= ?")
+                params.append(minimum)
+        sort_by = st.selectbox(
+            "Sort by",
+            list(sort_options),
+            index=list(sort_options).index(default_sort),
+            key=f"{key}_sort"
+        )
+    return conditions, params, sort_options[sort_by]
+
 def create_post():
     """Create and schedule posts for different platforms."""
     st.header("Create Post")
     
-    # Create temp directory if it doesn't exist
-    temp_dir = Path("temp")
-    temp_dir.mkdir(parents=True, exist_ok=True)
-    
     # Add tabs for new content vs existing content
     tab1, tab2 = st.tabs(["Upload New Content", "Use Existing Content"])
     
@@ -1224,109 +1232,107 @@ def create_post():
             for file in uploaded_files:
                 st.write(f"Processing: {file.name}")
                 
-                # Save file temporarily
-                temp_path = Path("temp") / f"temp_{file.name}"
-                temp_path.parent.mkdir(parents=True, exist_ok=True)
-                
-                with open(temp_path, "wb") as f:
-                    f.write(file.getbuffer())
+                # Save file to the media store (once per upload, not per rerun)
+                media_path, file_hash = store_upload(file)
                 
                 # Display media preview
-                if file.type.startswith('video'):
-                    st.video(temp_path)
-                else:
-                    st.image(temp_path)
+                load_and_display_media(media_path, file_hash=file_hash)
                 
                 # Post customization
                 with st.expander("Post Details", expanded=True):
-                    _handle_post_details(file.name, temp_path, platforms)
+                    _handle_post_details(file.name, media_path, platforms)
     
     with tab2:
-        # Connect to database
-        conn = sqlite3.connect('cat_content.db')
-        cursor = conn.cursor()
-        
         try:
-            # Get all analyzed content
-            cursor.execute("""
-                SELECT ca.id, ca.original_filename, ca.media_type, ca.total_score, 
-                       ca.caption, ca.hashtags, ca.file_path, ca.created_at,
-                       GROUP_CONCAT(DISTINCT ph.platform) as posted_platforms
-                FROM content_analysis ca
-                LEFT JOIN posting_history ph ON ca.id = ph.analysis_id
-                GROUP BY ca.id
-                ORDER BY ca.created_at DESC
-            """)
-            content_list = cursor.fetchall()
-            
-            if not content_list:
-                st.info("No existing content found in the database.")
-                return
-            
-            # Create a DataFrame for better display
-            df = pd.DataFrame(content_list, columns=[
-                'id', 'filename', 'media_type', 'score', 'caption', 
-                'hashtags', 'file_path', 'created_at', 'posted_platforms'
-            ])
-            
             # Add filters
             col1, col2, col3 = st.columns(3)
             with col1:
                 media_type_filter = st.multiselect(
                     "Filter by media type",
-                    df['media_type'].unique(),
-                    default=df['media_type'].unique()
+                    ['image', 'video'],
+                    default=['image', 'video']
                 )
             with col2:
                 min_score = st.number_input("Minimum score", 0, 50, 0)
             with col3:
-                search_term = st.text_input("Search in filename")
-            
-            # Apply filters
-            mask = (
-                df['media_type'].isin(media_type_filter) &
-                (df['score'] >= min_score)
+                search_term = st.text_input(
+                    "Search",
+                    help="Matches filenames, captions, hashtags, key strengths and engagement tips; "
+                         "results are ranked by relevance"
+                )
+            conditions, params, order_by = category_filter_controls('reuse', 'Newest')
+            page = st.number_input("Page", min_value=1, value=1, key="reuse_page")
+
+            conditions.append(f"ca.media_type IN ({', '.join('?' * len(media_type_filter))})")
+            params.extend(media_type_filter)
+            conditions.append("ca.total_score >= ?")
+            params.append(min_score)
+
+            # Get one page of the analyzed content matching the filters
+            content_list, total = repository.find_content(
+                search_term, conditions, params, order_by,
+                limit=CONTENT_PAGE_SIZE, offset=(page - 1) * CONTENT_PAGE_SIZE
             )
-            if search_term:
-                mask &= df['filename'].str.contains(search_term, case=False)
-            
-            filtered_df = df[mask]
-            
+
+            if not content_list:
+                st.info("No existing content matches these filters." if not total
+                        else f"There are only {total} matches; go back to an earlier page.")
+                return
+            st.caption(
+                f"Showing {(page - 1) * CONTENT_PAGE_SIZE + 1}–{(page - 1) * CONTENT_PAGE_SIZE + len(content_list)} "
+                f"of {total} (page {page} of {-(-total // CONTENT_PAGE_SIZE)})"
+            )
+
+            # Platforms each analysis on the page was scheduled or posted to
+            posting_history = repository.posting_history_by_analysis(row['id'] for row in content_list)
+            for row in content_list:
+                row['posted_platforms'] = ", ".join(sorted({
+                    platform for platform, _, _ in posting_history[row['id']] if platform
+                }))
+
+            # Create a DataFrame for better display
+            filtered_df = pd.DataFrame(content_list).rename(
+                columns={'original_filename': 'filename', 'total_score': 'score'}
+            )
+
             # Display filtered content
+            prefetch_previews(filtered_df['file_path'], file_hashes=filtered_df['file_hash'])
             for _, row in filtered_df.iterrows():
                 with st.expander(f"{row['filename']} (Score: {row['score']}/50)"):
                     col1, col2 = st.columns([1, 2])
                     
                     with col1:
                         try:
-                            # Load and display media
-                            original_path = Path(row['file_path'])
-                            temp_path = temp_dir / f"reuse_{row['id']}_{row['filename']}"
+                            # Load and display media straight from its stored path
+                            media_path = Path(row['file_path'])
                             
                             # Check if the original file exists
-                            if original_path.exists():
-                                # Copy file to temp directory if it doesn't exist or is outdated
-                                if not temp_path.exists() or temp_path.stat().st_mtime < original_path.stat().st_mtime:
-                                    import shutil
-                                    shutil.copy2(original_path, temp_path)
-                                
+                            if media_path.exists():
                                 # Display media
-                                if row['media_type'] == 'video':
-                                    st.video(str(temp_path))
-                                else:
-                                    st.image(str(temp_path))
+                                load_and_display_media(
+                                    media_path, GRID_SIZE, row['file_hash'], key=f"reuse_{row['id']}"
+                                )
                             else:
-                                st.error(f"Original file not found: {original_path}")
+                                st.error(f"Original file not found: {media_path}")
                                 continue
                         except Exception as e:
                             st.error(f"Error loading media: {e}")
                             continue
                     
                     with col2:
+                        # Show where the search matched
+                        if row['snippet']:
+                            st.markdown(f"> {' '.join(row['snippet'].split())}")
+                        
                         # Show posting history
                         if row['posted_platforms']:
                             st.write("Previously posted to:", row['posted_platforms'])
-                        
+                        st.caption(" · ".join(
+                            f"{category}: {row[column]:.0f}"
+                            for category, column in CATEGORY_SCORE_COLUMNS.items()
+                            if pd.notna(row[column])
+                        ))
+
                         # Platform selection for reposting
                         platforms = st.multiselect(
                             "Select platforms to post to:",
@@ -1390,7 +1396,7 @@ def create_post():
                                     try:
                                         post_data = {
                                             'id': row['id'],
-                                            'file_path': str(temp_path),
+                                            'file_path': str(media_path),
                                             'caption': caption,
                                             'hashtags': hashtags,
                                             'platforms': platforms,
@@ -1416,7 +1422,7 @@ def create_post():
                                     try:
                                         scheduled_post = {
                                             'id': row['id'],
-                                            'file_path': str(temp_path),
+                                            'file_path': str(media_path),
                                             'caption': caption,
                                             'hashtags': hashtags,
                                             'platforms': platforms,
@@ -1431,10 +1437,8 @@ def create_post():
                                         st.error(f"Error scheduling post: {e}")
         except Exception as e:
             st.error(f"Error accessing database: {e}")
-        finally:
-            conn.close()
 
-def _handle_post_details(filename, temp_path, platforms):
+def _handle_post_details(filename, media_path, platforms):
     """Helper function to handle post details form."""
     # Caption with character count
     caption = st.text_area(
@@ -1508,7 +1512,7 @@ def _handle_post_details(filename, temp_path, platforms):
         if st.button("Post Now", key=f"post_now_{filename}"):
             try:
                 post_data = {
-                    'file_path': str(temp_path),
+                    'file_path': str(media_path),
                     'caption': caption,
                     'hashtags': ' '.join(hashtags),
                     'platforms': platforms,
@@ -1533,7 +1537,7 @@ def _handle_post_details(filename, temp_path, platforms):
         if st.button("Schedule Post", key=f"schedule_{filename}"):
             try:
                 scheduled_post = {
-                    'file_path': str(temp_path),
+                    'file_path': str(media_path),
                     'caption': caption,
                     'hashtags': ' '.join(hashtags),
                     'platforms': platforms,
@@ -1558,70 +1562,72 @@ def auto_schedule_posts():
         st.subheader("Content Selection")
         
         # Connect to database
-        conn = sqlite3.connect('cat_content.db')
+        conn = database.connect(readonly=True)
         cursor = conn.cursor()
         
         try:
-            # Get all analyzed content that hasn't been posted yet or was posted more than 30 days ago
-            cursor.execute("""
-                SELECT 
-                    ca.id, 
-                    ca.original_filename, 
-                    ca.media_type, 
+            # Content filters
+            st.write("Filter Content")
+            col_filter1, col_filter2 = st.columns(2)
+
+            with col_filter1:
+                media_types = st.multiselect(
+                    "Media Type",
+                    ['image', 'video'],
+                    default=['image', 'video']
+                )
+
+            with col_filter2:
+                min_score = st.slider("Minimum Score", 0, 50, 30)
+            conditions, params, order_by = category_filter_controls('auto_schedule', 'Total score')
+
+            conditions.append(f"ca.media_type IN ({', '.join('?' * len(media_types))})")
+            params.extend(media_types)
+            conditions.append("ca.total_score >= ?")
+            params.append(min_score)
+
+            # Get matching content that hasn't been posted yet or was posted more than 30 days ago
+            cursor.execute(f"""
+                SELECT
+                    ca.id,
+                    ca.original_filename,
+                    ca.media_type,
                     ca.total_score,
-                    ca.caption, 
-                    ca.hashtags, 
+                    ca.caption,
+                    ca.hashtags,
                     ca.file_path,
+                    ca.file_hash,
                     ca.engagement_tips,
                     ca.key_strengths,
                     ca.improvement_suggestions,
                     GROUP_CONCAT(DISTINCT ph.platform) as posted_platforms,
-                    MAX(ph.posted_at) as last_posted
+                    MAX(ph.posted_at_ms) as last_posted_ms
                 FROM content_analysis ca
                 LEFT JOIN posting_history ph ON ca.id = ph.analysis_id
+                WHERE {' AND '.join(conditions)}
                 GROUP BY ca.id
-                HAVING last_posted IS NULL 
-                    OR datetime(last_posted) < datetime('now', '-30 days')
-                ORDER BY ca.total_score DESC
-            """)
+                HAVING last_posted_ms IS NULL OR last_posted_ms < ?
+                ORDER BY {order_by}
+            """, [*params, epoch_ms(datetime.now(pytz.UTC) - timedelta(days=30))])
             available_content = cursor.fetchall()
-            
+
             if not available_content:
-                st.warning("No content available for scheduling. Please analyze some content first.")
+                st.warning("No content available for scheduling. Analyze some content or relax the filters.")
                 return
-            
-            # Create DataFrame for content selection
-            df = pd.DataFrame(available_content, columns=[
-                'id', 'filename', 'media_type', 'score', 'caption', 
-                'hashtags', 'file_path', 'engagement_tips', 'key_strengths',
-                'improvement_suggestions', 'posted_platforms', 'last_posted'
+
+            # Create DataFrame for content selection, in the chosen sort order
+            filtered_df = pd.DataFrame(available_content, columns=[
+                'id', 'filename', 'media_type', 'score', 'caption',
+                'hashtags', 'file_path', 'file_hash', 'engagement_tips', 'key_strengths',
+                'improvement_suggestions', 'posted_platforms', 'last_posted_ms'
             ])
-            
-            # Content filters
-            st.write("Filter Content")
-            col_filter1, col_filter2 = st.columns(2)
-            
-            with col_filter1:
-                media_types = st.multiselect(
-                    "Media Type",
-                    df['media_type'].unique(),
-                    default=df['media_type'].unique()
-                )
-            
-            with col_filter2:
-                min_score = st.slider("Minimum Score", 0, 50, 30)
-            
-            # Apply filters
-            mask = (df['media_type'].isin(media_types)) & (df['score'] >= min_score)
-            
-            filtered_df = df[mask].copy()
-            
+
             # Content selection
             selected_content = st.multiselect(
                 "Select content to schedule",
                 filtered_df['filename'].tolist(),
                 default=filtered_df['filename'].head(5).tolist(),
-                help="Choose the content you want to schedule. Selected content will be scheduled based on quality score."
+                help="Choose the content you want to schedule. Selected content is scheduled in the order chosen under Sort by."
             )
             
             if not selected_content:
@@ -1672,9 +1678,7 @@ def auto_schedule_posts():
         if generate_schedule and selected_content:
             st.subheader("Generated Schedule")
             
-            # Sort selected content by score
-            selected_df = selected_df.sort_values('score', ascending=False)
-            
+            # Selected content keeps the order chosen under "Sort by"
             # Generate posting schedule
             schedule = []
             current_date = datetime.now(pytz.UTC).date()
@@ -1702,6 +1706,7 @@ def auto_schedule_posts():
                                     'id': content['id'],
                                     'original_filename': content['filename'],
                                     'file_path': content['file_path'],
+                                    'file_hash': content['file_hash'],
                                     'media_type': content['media_type'],
                                     'total_score': content['score'],
                                     'caption': content['caption'],
@@ -1718,7 +1723,11 @@ def auto_schedule_posts():
                 current_date += timedelta(days=1)
             
             # Display timeline
-            for post in schedule:
+            prefetch_previews(
+                [post['content']['file_path'] for post in schedule],
+                file_hashes=[post['content']['file_hash'] for post in schedule]
+            )
+            for i, post in enumerate(schedule):
                 post_expander = st.expander(
                     f"📅 {post['datetime'].strftime('%A, %B %d, %I:%M %p')} - {post['content']['original_filename']}", 
                     expanded=True
@@ -1730,10 +1739,10 @@ def auto_schedule_posts():
                     with col1:
                         # Display media preview
                         try:
-                            if post['content']['media_type'] == 'video':
-                                st.video(post['content']['file_path'])
-                            else:
-                                st.image(post['content']['file_path'])
+                            load_and_display_media(
+                                post['content']['file_path'], GRID_SIZE, post['content']['file_hash'],
+                                key=f"schedule_{i}"
+                            )
                         except Exception as e:
                             st.error(f"Error loading media: {e}")
                     
@@ -1807,7 +1816,7 @@ def view_posted_content():
     st.header("Posted Content History")
     
     # Connect to database
-    conn = sqlite3.connect('cat_content.db')
+    conn = database.connect(readonly=True)
     cursor = conn.cursor()
     
     try:
@@ -1822,13 +1831,14 @@ def view_posted_content():
                 ca.hashtags,
                 ca.file_path,
                 ph.platform,
-                ph.posted_at,
+                ph.posted_at_ms,
                 ph.status,
-                ph.id as post_history_id
+                ph.id as post_history_id,
+                ca.file_hash
             FROM content_analysis ca
             JOIN posting_history ph ON ca.id = ph.analysis_id
             WHERE ph.status = 'success'
-            ORDER BY ph.posted_at DESC
+            ORDER BY ph.posted_at_ms DESC
         """)
         posts = cursor.fetchall()
         
@@ -1836,46 +1846,31 @@ def view_posted_content():
             st.info("No posted content found in the history.")
             return
         
-        # Group posts by date
-        from itertools import groupby
-        from datetime import datetime
-        
-        # Convert posts to list of dicts for easier handling
+        # Convert posts to list of dicts for easier handling, newest first
         posts_data = []
         for p in posts:
-            try:
-                # Handle different datetime string formats
-                posted_at_str = p[8]
-                try:
-                    # Try parsing with timezone
-                    posted_at = datetime.strptime(posted_at_str.split('+')[0], '%Y-%m-%d %H:%M:%S.%f')
-                except ValueError:
-                    try:
-                        # Try parsing without microseconds
-                        posted_at = datetime.strptime(posted_at_str.split('+')[0], '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        # If all else fails, try basic format
-                        posted_at = datetime.strptime(posted_at_str, '%Y-%m-%d %H:%M:%S')
-                
-                posts_data.append({
-                    'id': p[0],
-                    'filename': p[1],
-                    'media_type': p[2],
-                    'score': p[3],
-                    'caption': p[4],
-                    'hashtags': p[5],
-                    'file_path': p[6],
-                    'platform': p[7],
-                    'posted_at': posted_at,
-                    'status': p[9],
-                    'post_history_id': p[10]  # Add unique post history ID
-                })
-            except Exception as e:
-                st.warning(f"Skipping post due to date parsing error: {e}")
+            if p[8] is None:
+                st.warning(f"Skipping {p[1]}: its posting time could not be read")
                 continue
+            posts_data.append({
+                'id': p[0],
+                'filename': p[1],
+                'media_type': p[2],
+                'score': p[3],
+                'caption': p[4],
+                'hashtags': p[5],
+                'file_path': p[6],
+                'platform': p[7],
+                'posted_at': from_epoch_ms(p[8]),
+                'status': p[9],
+                'post_history_id': p[10],  # Add unique post history ID
+                'file_hash': p[11]
+            })
         
-        # Sort posts by date
-        posts_data.sort(key=lambda x: x['posted_at'], reverse=True)
+        # Engagement metrics for every post, looked up while rendering
+        engagement_metrics = repository.engagement_metrics_by_post(
+            (p['id'], p['platform']) for p in posts_data
+        )
         
         # Group by date
         current_date = None
@@ -1922,6 +1917,10 @@ def view_posted_content():
                 ]
                 
                 # Display posts in a grid
+                prefetch_previews(
+                    [p['file_path'] for p in filtered_posts],
+                    file_hashes=[p['file_hash'] for p in filtered_posts]
+                )
                 cols = st.columns(3)
                 for i, post in enumerate(filtered_posts):
                     with cols[i % 3]:
@@ -1930,39 +1929,18 @@ def view_posted_content():
                             # Check if media file exists
                             file_path = Path(post['file_path'])
                             if file_path.exists():
-                                if post['media_type'] == 'video':
-                                    st.video(str(file_path))
-                                else:
-                                    st.image(str(file_path))
+                                load_and_display_media(
+                                    file_path, GRID_SIZE, post['file_hash'], key=f"posted_{post_date}_{i}"
+                                )
                             else:
-                                # Try to find the file in temp directory
-                                temp_file = Path("temp") / f"reuse_{post['id']}_{post['filename']}"
-                                if temp_file.exists():
-                                    if post['media_type'] == 'video':
-                                        st.video(str(temp_file))
-                                    else:
-                                        st.image(str(temp_file))
-                                else:
-                                    st.warning(f"Media file not found: {post['filename']}")
-                                    # Update the file path in the database to point to temp directory
-                                    cursor.execute("""
-                                        UPDATE content_analysis
-                                        SET file_path = ?
-                                        WHERE id = ?
-                                    """, (str(temp_file), post['id']))
-                                    conn.commit()
+                                st.warning(f"Media file not found: {post['filename']}")
                             
                             # Post details
                             st.write(f"**File:** {post['filename']}")
                             st.write(f"**Score:** {post['score']}/50")
                             
                             # Engagement metrics
-                            cursor.execute("""
-                                SELECT likes, comments, shares, views
-                                FROM engagement_metrics
-                                WHERE post_id = ? AND platform = ?
-                            """, (post['id'], post['platform']))
-                            metrics = cursor.fetchone()
+                            metrics = engagement_metrics.get((post['id'], post['platform']))
                             
                             if metrics:
                                 metric_cols = st.columns(4)
@@ -1988,7 +1966,8 @@ def view_posted_content():
                                 st.session_state.pending_posts.append({
                                     'analysis': {
                                         'id': post['id'],
-                                        'file_path': str(file_path) if file_path.exists() else str(temp_file),
+                                        'file_path': str(file_path),
+                                        'file_hash': post['file_hash'],
                                         'caption': post['caption'],
                                         'hashtags': post['hashtags'],
                                         'media_type': post['media_type'],
@@ -2193,10 +2172,13 @@ def main():
                 with st.spinner("Analyzing content..."):
                     results = analyze_media(uploaded_files)
                     
+                posting_history = repository.posting_history_by_analysis(
+                    analysis.get('id') for analysis in results
+                )
                 for analysis in results:
                     st.divider()
                     display_analysis_results(analysis)
-                    schedule_post(analysis)
+                    schedule_post(analysis, posting_history.get(analysis.get('id'), []))
     
     elif selected == "Create Posts":
         create_post()
@@ -2236,4 +2218,9 @@ def main():
     st.markdown('</main>', unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    if SHOW_QUERY_COUNT:
+        with count_queries() as statements:
+            main()
+        st.caption(f"{len(statements)} SQL statements in this render")
+    else:
+        main() 
\ No newline at end of file
@@ -0,0 +1,237 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Database shared by the control center, the analyzer and the Celery workers
+DB_PATH = os.getenv('CAT_CONTENT_DB', 'cat_content.db')
+# Milliseconds a connection waits for another process's write lock before
+# failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 30000))
+# Page cache per connection, in KiB
+SQLITE_CACHE_SIZE_KB = 16 * 1024
+# Bytes of the database file read through memory-mapped I/O
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+# Idle connections kept open per pool; busier threads open extra ones
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 8))
+
+def epoch_ms(dt=None):
+    """UTC epoch milliseconds of a datetime, or of now; naive datetimes are taken as UTC.
+
+    Timestamps are stored in ``*_ms`` INTEGER columns in this form so range
+    queries compare plain integers and can use an index.
+    """
+    if dt is None:
+        dt = datetime.now(timezone.utc)
+    elif dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+def from_epoch_ms(ms):
+    """Timezone-aware UTC datetime for epoch milliseconds (None stays None)."""
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, timezone.utc)
+
+# Active count_queries blocks
+_query_counters = []
+_query_counters_lock = threading.Lock()
+
+def _count_query(statement):
+    # SQLite reports statements run inside triggers and virtual tables (such
+    # as FTS5 index lookups) as "-- ..." comments; they are not round trips
+    if statement.startswith('--'):
+        return
+    with _query_counters_lock:
+        for counter in _query_counters:
+            counter.append(statement)
+
+@contextmanager
+def count_queries():
+    """Record every SQL statement run through the pools during the block.
+
+    Yields a list that fills with the statements as they run, so tests and
+    debug output can check how many round trips a page or task makes.
+    Statements from every thread are counted, but only on connections
+    taken from a pool inside the block, and not the statements SQLite runs
+    internally for triggers and virtual tables.
+    """
+    statements = []
+    with _query_counters_lock:
+        _query_counters.append(statements)
+    try:
+        yield statements
+    finally:
+        with _query_counters_lock:
+            _query_counters.remove(statements)
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that returns to its pool when closed.
+
+    Existing ``conn = ...; conn.close()`` code can use pooled connections
+    unchanged. Any transaction still open at close is rolled back.
+    """
+
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def discard(self):
+        """Close the underlying connection instead of returning it to the pool."""
+        self.pool = None
+        super().close()
+
+class ConnectionPool:
+    """Idle connections to one database, reused instead of reopened.
+
+    The pool never blocks: ``acquire`` opens a new connection when none is
+    idle, and ``release`` closes connections beyond ``max_idle``. Pools
+    inherited through ``fork`` (Celery's prefork workers) start empty in the
+    child, since SQLite connections must not cross processes.
+    """
+
+    def __init__(self, db_path, readonly=False, max_idle=SQLITE_POOL_SIZE):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _open(self):
+        # Writers begin every implicit transaction with BEGIN IMMEDIATE, so they
+        # wait for the write lock up front (honouring busy_timeout) instead of
+        # failing when a deferred read transaction cannot be upgraded
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None if self.readonly else 'IMMEDIATE',
+            check_same_thread=False,
+            factory=PooledConnection
+        )
+        conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+        # NORMAL is durable across application crashes in WAL mode; only an
+        # OS crash or power loss can roll back the last commits
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+        conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        if self.readonly:
+            conn.execute('PRAGMA query_only = ON')
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, or open one."""
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's connections belong to the parent
+                self._idle = []
+                self._pid = os.getpid()
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._open()
+        conn.set_trace_callback(_count_query if _query_counters else None)
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.discard()
+            return
+        with self._lock:
+            if self._pid == os.getpid() and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.discard()
+
+    def close_all(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.discard()
+
+class Database:
+    """Pooled access to one SQLite database in WAL mode.
+
+    Reads go through query-only connections and writes through connections
+    that take the write lock with ``BEGIN IMMEDIATE``. In WAL mode readers
+    never block the writer or each other, and every connection waits up to
+    ``SQLITE_BUSY_TIMEOUT_MS`` for another process's write to finish.
+    """
+
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._readers = ConnectionPool(db_path, readonly=True)
+        self._writers = ConnectionPool(db_path)
+        # The journal mode is stored in the database file, so this only has
+        # an effect the first time
+        conn = self._writers.acquire()
+        try:
+            conn.execute('PRAGMA journal_mode = WAL')
+        finally:
+            conn.close()
+
+    def connect(self, readonly=False):
+        """Take a pooled connection; ``close()`` returns it to the pool.
+
+        Write connections begin a transaction (``BEGIN IMMEDIATE``) at the
+        first INSERT, UPDATE or DELETE, which lasts until ``commit()``.
+        """
+        return (self._readers if readonly else self._writers).acquire()
+
+    @contextmanager
+    def read(self):
+        """Query-only connection for the duration of the block."""
+        conn = self._readers.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def write(self):
+        """Connection holding a write transaction for the duration of the block.
+
+        The transaction starts with ``BEGIN IMMEDIATE``, so reads made in the
+        block see no concurrent writes. It is committed when the block exits
+        (code in the block may also commit early) and rolled back if it raises.
+        """
+        conn = self._writers.acquire()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def close(self):
+        """Close all idle pooled connections."""
+        self._readers.close_all()
+        self._writers.close_all()
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+def get_database(db_path=DB_PATH):
+    """Get the process-wide Database for a database file."""
+    key = os.path.abspath(db_path)
+    with _databases_lock:
+        database = _databases.get(key)
+        if database is None:
+            database = _databases[key] = Database(db_path)
+        return database
@@ -0,0 +1,207 @@
+import os
+import time
+import signal
+import logging
+import argparse
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from cat_content_analyzer import (
+    CatContentAnalyzer,
+    IMAGE_EXTENSIONS,
+    VIDEO_EXTENSIONS,
+    DEFAULT_MAX_CONCURRENCY,
+    ANALYSIS_VERSION,
+)
+from job_queue import AnalysisJobQueue, make_worker_id
+from media_scanner import MediaScanner, ScanIndex
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler('ingest.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger('cat_content_ingest')
+
+# Seconds a file's size and mtime must stay unchanged before it is queued
+SETTLE_SECONDS = 5.0
+# Seconds between debounce checks and queue polls
+POLL_INTERVAL = 1.0
+
+def is_supported_media(path):
+    """Check whether a path is a media file the analyzer can handle."""
+    path = Path(path)
+    # Skip hidden files and partial-download placeholders like ._IMG_0001.jpg
+    return not path.name.startswith('.') and path.suffix.lower() in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS
+
+class WriteDebouncer:
+    """Hold files until they stop changing, so partially written files are not analyzed."""
+
+    def __init__(self, settle_seconds=SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self._pending = {}  # path -> (last change time, (size, mtime_ns))
+        self._lock = threading.Lock()
+
+    def touch(self, path):
+        """Record activity on a file."""
+        if is_supported_media(path):
+            with self._lock:
+                self._pending[str(path)] = (time.monotonic(), None)
+
+    def ready(self):
+        """Return files that have been unchanged for settle_seconds."""
+        now = time.monotonic()
+        settled = []
+        with self._lock:
+            for path, (last_change, signature) in list(self._pending.items()):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Deleted or renamed before it settled
+                    del self._pending[path]
+                    continue
+                current = (stat.st_size, stat.st_mtime_ns)
+                if current != signature:
+                    self._pending[path] = (now, current)
+                elif stat.st_size > 0 and now - last_change >= self.settle_seconds:
+                    settled.append(path)
+                    del self._pending[path]
+        return settled
+
+class MediaEventHandler(FileSystemEventHandler):
+    """Forward new, changed and moved-in media files to the debouncer."""
+
+    def __init__(self, debouncer):
+        super().__init__()
+        self.debouncer = debouncer
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.debouncer.touch(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.debouncer.touch(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.debouncer.touch(event.dest_path)
+
+class IngestService:
+    """Watch media directories and analyze new or changed files as they land."""
+
+    def __init__(self, directories, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 settle_seconds=SETTLE_SECONDS, scan_existing=False):
+        self.directories = [Path(d) for d in directories]
+        self.max_concurrency = max_concurrency
+        self.scan_existing = scan_existing
+        self.debouncer = WriteDebouncer(settle_seconds)
+        self.queue = AnalysisJobQueue()
+        self.worker_id = make_worker_id()
+        self.analyzer = CatContentAnalyzer()
+        self.scan_index = ScanIndex(ANALYSIS_VERSION)
+        self._stop = threading.Event()
+
+    def stop(self, *args):
+        """Ask the service to shut down after in-flight analyses finish."""
+        self._stop.set()
+
+    def _enqueue_existing(self):
+        """Queue files in the watched directories that are new or changed since they were analyzed."""
+        scanner = MediaScanner(self.scan_index, IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)
+        queued = 0
+        for directory in self.directories:
+            for path in scanner.scan(directory):
+                queued += self.queue.enqueue(path)
+        logger.info(f"Queued {queued} existing files ({len(scanner.skipped)} unchanged)")
+
+    def _process(self, job_id, file_path):
+        """Analyze one queued file and record the outcome."""
+        try:
+            stat = os.stat(file_path)
+            analysis = self.analyzer.analyze_media(file_path)
+            self.queue.complete(job_id, analysis.get('id'))
+            self.scan_index.record(file_path, stat.st_size, stat.st_mtime_ns, analysis.get('file_hash'))
+            logger.info(f"Analyzed {file_path}: Total Score {analysis['total_score']}/50")
+        except Exception as e:
+            self.queue.fail(job_id, e, self.worker_id, retry=not isinstance(e, FileNotFoundError))
+            logger.error(f"Error analyzing {file_path}: {e}", exc_info=True)
+        finally:
+            # The daemon never builds a posting schedule, so don't keep results in memory
+            self.analyzer.analyzed_content.clear()
+
+    def run(self):
+        """Run until stopped, keeping at most max_concurrency analyses in flight.
+
+        Jobs interrupted by a previous run are claimed again once their
+        leases expire, as are jobs of other workers sharing the database.
+        """
+        logger.info(f"Starting ingest worker {self.worker_id}")
+        observer = Observer()
+        handler = MediaEventHandler(self.debouncer)
+        for directory in self.directories:
+            observer.schedule(handler, str(directory), recursive=True)
+            logger.info(f"Watching {directory}")
+        observer.start()
+
+        if self.scan_existing:
+            self._enqueue_existing()
+
+        in_flight = set()
+        with self.queue.leases_kept(self.worker_id), \
+                ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            try:
+                while not self._stop.is_set():
+                    for path in self.debouncer.ready():
+                        if self.queue.enqueue(path):
+                            logger.info(f"Queued {path}")
+
+                    in_flight = {future for future in in_flight if not future.done()}
+                    while len(in_flight) < self.max_concurrency:
+                        job = self.queue.claim(self.worker_id)
+                        if not job:
+                            break
+                        in_flight.add(executor.submit(self._process, *job))
+
+                    self._stop.wait(POLL_INTERVAL)
+            finally:
+                observer.stop()
+                observer.join()
+                logger.info("Waiting for in-flight analyses to finish")
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch folders and analyze new cat media as it arrives")
+    parser.add_argument('directories', nargs='+', help="Media directories to watch (recursively)")
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help=f"Maximum number of files analyzed at once (default: {DEFAULT_MAX_CONCURRENCY})"
+    )
+    parser.add_argument(
+        '--settle-seconds',
+        type=float,
+        default=SETTLE_SECONDS,
+        help=f"Seconds a file must stop changing before it is queued (default: {SETTLE_SECONDS})"
+    )
+    parser.add_argument(
+        '--scan-existing',
+        action='store_true',
+        help="Also queue files already present in the directories at startup"
+    )
+    args = parser.parse_args()
+
+    service = IngestService(args.directories, args.max_concurrency, args.settle_seconds, args.scan_existing)
+    signal.signal(signal.SIGTERM, service.stop)
+    signal.signal(signal.SIGINT, service.stop)
+    service.run()
+
+if __name__ == "__main__":
+    main()
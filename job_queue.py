@@ -0,0 +1,264 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+from db import get_database, DB_PATH
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+# Seconds a claimed job stays leased to its worker without a renewal
+LEASE_SECONDS = int(os.getenv('ANALYSIS_JOB_LEASE_SECONDS', 300))
+# Attempts (claims) before a job is left failed for good
+MAX_ATTEMPTS = int(os.getenv('ANALYSIS_JOB_MAX_ATTEMPTS', 3))
+# Delay before a failed job is retried; doubled after each attempt
+RETRY_BACKOFF_SECONDS = 30
+# enqueue_many writes a chunk once it holds this many paths, or once this many
+# seconds have passed since its first path, whichever comes first
+ENQUEUE_CHUNK_SIZE = 500
+ENQUEUE_FLUSH_SECONDS = 1.0
+
+def make_worker_id():
+    """Identifier for one worker process, unique across hosts and restarts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+class AnalysisJobQueue:
+    """Persistent queue of media files waiting for analysis.
+
+    Jobs live in the ``analysis_jobs`` table of the content database, so
+    queued work survives restarts. Each job moves from ``queued`` to
+    ``running`` and then to ``done`` or ``failed``.
+
+    Claiming a job leases it to one worker until ``lease_expires_at``.
+    Workers renew their leases while they run (see ``leases_kept``); a job
+    whose lease runs out because its worker died is handed to the next
+    worker that claims, so any number of processes can drain the queue and
+    a crashed run resumes where it stopped. Failed jobs are retried with
+    backoff until they have been attempted ``max_attempts`` times.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_attempts=MAX_ATTEMPTS):
+        self.db = get_database(db_path)
+        self.max_attempts = max_attempts
+        # analysis_jobs is created by migrations.py
+        migrate(self.db)
+
+    def _insert(self, conn, file_path, worker_id=None, lease_seconds=LEASE_SECONDS):
+        """Insert a job unless one for the file is queued or running; returns its id or None."""
+        existing = conn.execute('''
+        SELECT 1 FROM analysis_jobs
+        WHERE file_path = ? AND status IN ('queued', 'running')
+        ''', (str(file_path),)).fetchone()
+        if existing:
+            return None
+        if worker_id is None:
+            cursor = conn.execute('''
+            INSERT INTO analysis_jobs (file_path) VALUES (?)
+            ''', (str(file_path),))
+        else:
+            cursor = conn.execute('''
+            INSERT INTO analysis_jobs (file_path, status, attempts, lease_owner, lease_expires_at)
+            VALUES (?, 'running', 1, ?, ?)
+            ''', (str(file_path), worker_id, _now_ms() + int(lease_seconds * 1000)))
+        return cursor.lastrowid
+
+    def enqueue(self, file_path):
+        """Queue a file unless it is already waiting or being analyzed.
+
+        Returns True if a new job was created.
+        """
+        with self.db.write() as conn:
+            return self._insert(conn, file_path) is not None
+
+    def enqueue_many(self, file_paths, chunk_size=ENQUEUE_CHUNK_SIZE, flush_seconds=ENQUEUE_FLUSH_SECONDS):
+        """Queue many files with one short transaction per chunk; returns the number of new jobs.
+
+        ``file_paths`` is consumed outside any transaction, so a slow
+        directory walk never holds the database write lock, and each chunk
+        can be claimed by workers while the rest is still being produced.
+        The age of a chunk is checked as each path arrives.
+        """
+        queued = 0
+        chunk = []
+        chunk_started = None
+
+        def flush():
+            with self.db.write() as conn:
+                return sum(self._insert(conn, file_path) is not None for file_path in chunk)
+
+        for file_path in file_paths:
+            if not chunk:
+                chunk_started = time.monotonic()
+            chunk.append(file_path)
+            if len(chunk) >= chunk_size or time.monotonic() - chunk_started >= flush_seconds:
+                queued += flush()
+                chunk = []
+        if chunk:
+            queued += flush()
+        return queued
+
+    def start(self, file_path, worker_id, lease_seconds=LEASE_SECONDS):
+        """Record a job that the caller analyzes right away, already leased to worker_id.
+
+        If the caller dies before completing it, the job is picked up by
+        another worker once the lease expires. Returns the job id, or None
+        if the file already has a queued or running job.
+        """
+        with self.db.write() as conn:
+            return self._insert(conn, file_path, worker_id, lease_seconds)
+
+    def _expire_leases(self, conn, now):
+        """Requeue running jobs whose worker stopped renewing its lease."""
+        expired = '''
+        status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+        '''
+        failed = conn.execute(f'''
+        UPDATE analysis_jobs
+        SET status = 'failed', error_message = 'Worker lease expired', lease_owner = NULL,
+            lease_expires_at = NULL, updated_at = datetime('now')
+        WHERE {expired} AND attempts >= ?
+        ''', (now, self.max_attempts)).rowcount
+        requeued = conn.execute(f'''
+        UPDATE analysis_jobs
+        SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL,
+            updated_at = datetime('now')
+        WHERE {expired}
+        ''', (now,)).rowcount
+        if failed or requeued:
+            logger.warning(f"Requeued {requeued} and failed {failed} analysis jobs with expired leases")
+
+    def claim(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Lease the oldest available job to worker_id and return ``(job_id, file_path)``.
+
+        Runs in a single write transaction, so concurrent workers never
+        claim the same job. Returns None when no job is available.
+        """
+        now = _now_ms()
+        with self.db.write() as conn:
+            self._expire_leases(conn, now)
+            job = conn.execute('''
+            SELECT id, file_path FROM analysis_jobs
+            WHERE status = 'queued' AND available_at <= ?
+            ORDER BY id
+            LIMIT 1
+            ''', (now,)).fetchone()
+            if job:
+                conn.execute('''
+                UPDATE analysis_jobs
+                SET status = 'running', attempts = attempts + 1, lease_owner = ?,
+                    lease_expires_at = ?, updated_at = datetime('now')
+                WHERE id = ?
+                ''', (worker_id, now + int(lease_seconds * 1000), job[0]))
+            return job
+
+    def iter_claims(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Yield ``(job_id, file_path)`` pairs, claiming each as it is consumed, until none are available."""
+        while True:
+            job = self.claim(worker_id, lease_seconds)
+            if job is None:
+                return
+            yield job
+
+    def renew_leases(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Extend the leases of every job worker_id is running; returns how many were renewed."""
+        with self.db.write() as conn:
+            return conn.execute('''
+            UPDATE analysis_jobs SET lease_expires_at = ?
+            WHERE status = 'running' AND lease_owner = ?
+            ''', (_now_ms() + int(lease_seconds * 1000), worker_id)).rowcount
+
+    @contextmanager
+    def leases_kept(self, worker_id, lease_seconds=LEASE_SECONDS):
+        """Renew worker_id's leases from a background thread for the duration of the block."""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(lease_seconds / 3):
+                try:
+                    self.renew_leases(worker_id, lease_seconds)
+                except sqlite3.Error as e:
+                    logger.error(f"Could not renew analysis job leases: {e}")
+
+        thread = threading.Thread(target=renew, name='analysis-job-leases', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, job_id, analysis_id):
+        """Mark a job as done."""
+        with self.db.write() as conn:
+            conn.execute('''
+            UPDATE analysis_jobs
+            SET status = 'done', analysis_id = ?, error_message = NULL, lease_owner = NULL,
+                lease_expires_at = NULL, updated_at = datetime('now')
+            WHERE id = ?
+            ''', (analysis_id, job_id))
+
+    def fail(self, job_id, error_message, worker_id=None, retry=True):
+        """Record a failed attempt.
+
+        The job is queued again after a backoff unless ``retry`` is False or
+        it has used up its attempts, in which case it is marked failed. With
+        ``worker_id``, nothing changes if the job's lease has since passed to
+        another worker.
+        """
+        with self.db.write() as conn:
+            job = conn.execute('''
+            SELECT attempts, lease_owner FROM analysis_jobs WHERE id = ? AND status = 'running'
+            ''', (job_id,)).fetchone()
+            if not job or (worker_id is not None and job[1] != worker_id):
+                return
+            attempts = job[0]
+            retrying = retry and attempts < self.max_attempts
+            conn.execute('''
+            UPDATE analysis_jobs
+            SET status = ?, error_message = ?, available_at = ?, lease_owner = NULL,
+                lease_expires_at = NULL, updated_at = datetime('now')
+            WHERE id = ?
+            ''', (
+                'queued' if retrying else 'failed',
+                str(error_message),
+                _now_ms() + RETRY_BACKOFF_SECONDS * 1000 * 2 ** max(attempts - 1, 0),
+                job_id
+            ))
+
+    def requeue_running(self, worker_id=None):
+        """Return running jobs to the queue right away instead of waiting for their leases.
+
+        Only safe for jobs of workers known to be gone: pass the worker_id of
+        a dead worker, or None when no other worker shares the database.
+        """
+        with self.db.write() as conn:
+            if worker_id is None:
+                cursor = conn.execute('''
+                UPDATE analysis_jobs
+                SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL,
+                    updated_at = datetime('now')
+                WHERE status = 'running'
+                ''')
+            else:
+                cursor = conn.execute('''
+                UPDATE analysis_jobs
+                SET status = 'queued', lease_owner = NULL, lease_expires_at = NULL,
+                    updated_at = datetime('now')
+                WHERE status = 'running' AND lease_owner = ?
+                ''', (worker_id,))
+            return cursor.rowcount
+
+    def counts(self):
+        """Number of jobs in each status."""
+        with self.db.read() as conn:
+            return dict(conn.execute('''
+            SELECT status, COUNT(*) FROM analysis_jobs GROUP BY status
+            ''').fetchall())
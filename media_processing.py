@@ -0,0 +1,273 @@
+import io
+import os
+import math
+import mimetypes
+from pathlib import Path
+from PIL import Image, ImageOps
+
+# Longest edge (in pixels) of images uploaded to Gemini
+UPLOAD_MAX_EDGE = int(os.getenv('GEMINI_UPLOAD_MAX_EDGE', 1536))
+# JPEG quality used when re-encoding images for upload
+UPLOAD_JPEG_QUALITY = int(os.getenv('GEMINI_UPLOAD_JPEG_QUALITY', 85))
+
+# Number of frames sampled from each video for analysis
+VIDEO_SAMPLE_FRAMES = int(os.getenv('GEMINI_VIDEO_SAMPLE_FRAMES', 6))
+# Frame sampling strategies: evenly spaced or at the largest scene changes
+VIDEO_SAMPLING_MODES = ('uniform', 'scene')
+# Frame sampling strategy used unless one is passed explicitly
+VIDEO_SAMPLING_MODE = os.getenv('GEMINI_VIDEO_SAMPLING', 'uniform')
+# Candidate frames probed per sampled frame when looking for scene changes
+SCENE_CANDIDATES_PER_FRAME = 3
+# Minimum gap between scene-change frames, as a fraction of an even segment
+# (frame_count / num_frames), so the picks are not clustered in one part of the clip
+SCENE_MIN_SPACING = 0.5
+# Longest edge of each frame in a contact sheet
+CONTACT_SHEET_CELL_EDGE = 512
+
+# content_analysis columns filled in by probe_media
+MEDIA_PROBE_COLUMNS = ('mime_type', 'width', 'height', 'duration', 'fps', 'bitrate', 'file_size')
+# Image formats Gemini accepts as-is when re-encoding would not shrink them
+GEMINI_IMAGE_MIME_TYPES = ('image/jpeg', 'image/png', 'image/webp')
+# EXIF tag holding the orientation of an image
+_EXIF_ORIENTATION_TAG = 0x0112
+# EXIF orientations that rotate an image by 90 degrees
+_EXIF_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+def _to_rgb(img):
+    """Convert an image to RGB, flattening any transparency onto white."""
+    if img.mode == 'RGB':
+        return img
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        return background
+    return img.convert('RGB')
+
+def normalize_image(img, max_edge=UPLOAD_MAX_EDGE):
+    """Apply EXIF orientation, downscale to max_edge and convert to RGB."""
+    # Let the JPEG decoder skip detail we are about to throw away
+    if img.format == 'JPEG':
+        img.draft('RGB', (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+    img = _to_rgb(img)
+    if max(img.size) > max_edge:
+        img = img.copy()
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    return img
+
+def encode_jpeg(img, quality=UPLOAD_JPEG_QUALITY):
+    """Encode an RGB image as JPEG bytes."""
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def prepare_image_for_upload(source, max_edge=UPLOAD_MAX_EDGE, quality=UPLOAD_JPEG_QUALITY):
+    """Normalize an image file or PIL image into a compact JPEG for Gemini.
+
+    Returns ``(part, stats)`` where ``part`` is an inline image part accepted
+    by ``generate_content`` and ``stats`` reports the original and uploaded
+    sizes in bytes. ``original_bytes`` and ``bytes_saved`` are None when the
+    source is an in-memory image. Files that are already small, upright and
+    in a format Gemini accepts are uploaded as they are when re-encoding
+    would not make them smaller.
+    """
+    original_bytes = None
+    if isinstance(source, (str, Path)):
+        original_bytes = os.path.getsize(source)
+        with Image.open(source) as img:
+            mime_type = Image.MIME.get(img.format)
+            upright = img.getexif().get(_EXIF_ORIENTATION_TAG, 1) == 1
+            fits = max(img.size) <= max_edge
+            data = encode_jpeg(normalize_image(img, max_edge), quality)
+        if (len(data) >= original_bytes and upright and fits
+                and mime_type in GEMINI_IMAGE_MIME_TYPES):
+            with open(source, 'rb') as f:
+                original = f.read()
+            stats = {'original_bytes': original_bytes, 'upload_bytes': original_bytes, 'bytes_saved': 0}
+            return {'mime_type': mime_type, 'data': original}, stats
+    else:
+        data = encode_jpeg(normalize_image(source, max_edge), quality)
+
+    stats = {
+        'original_bytes': original_bytes,
+        'upload_bytes': len(data),
+        'bytes_saved': original_bytes - len(data) if original_bytes is not None else None
+    }
+    return {'mime_type': 'image/jpeg', 'data': data}, stats
+
+def _read_frame_at(cap, frame_index):
+    """Seek to a frame index and decode just that frame as an RGB PIL image."""
+    import cv2
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+    ret, frame = cap.read()
+    if not ret:
+        return None
+    return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+def _frame_signature(img):
+    """Small grayscale histogram used to compare frames for scene changes."""
+    histogram = img.convert('L').resize((64, 64)).histogram()
+    total = float(sum(histogram)) or 1.0
+    return [count / total for count in histogram]
+
+def _evenly_spaced(frame_count, num_frames):
+    """Frame indices at the centre of num_frames equal segments of the clip.
+
+    Sampling segment centres skips the first frame, which is often black.
+    """
+    return sorted({
+        min(frame_count - 1, int((i + 0.5) * frame_count / num_frames))
+        for i in range(num_frames)
+    })
+
+def _pick_scene_changes(frame_indices, scores, num_frames, min_gap):
+    """Positions of the num_frames highest scores at least min_gap frames apart.
+
+    Candidates are taken greedily by score, skipping any closer than
+    ``min_gap`` to one already picked. If that leaves too few, the best
+    skipped candidates fill the remaining slots. Returned in clip order.
+    """
+    ranked = sorted(range(len(frame_indices)), key=lambda i: scores[i], reverse=True)
+    keep = []
+    for i in ranked:
+        if all(abs(frame_indices[i] - frame_indices[j]) >= min_gap for j in keep):
+            keep.append(i)
+            if len(keep) == num_frames:
+                break
+    for i in ranked:
+        if len(keep) == num_frames:
+            break
+        if i not in keep:
+            keep.append(i)
+    return sorted(keep)
+
+def sample_video_frames(video_path, num_frames=VIDEO_SAMPLE_FRAMES, mode=VIDEO_SAMPLING_MODE,
+                        max_edge=CONTACT_SHEET_CELL_EDGE):
+    """Decode a bounded set of frames from a video without reading the whole stream.
+
+    ``uniform`` seeks to ``num_frames`` evenly spaced timestamps. ``scene``
+    probes ``num_frames * SCENE_CANDIDATES_PER_FRAME`` evenly spaced
+    candidates and keeps the ones that differ most from their predecessor,
+    at least ``SCENE_MIN_SPACING`` of an even segment apart.
+    Either way the number of decoded frames is independent of the clip
+    length, and each frame is downscaled to ``max_edge`` as soon as it is
+    decoded. Returns ``[(timestamp_seconds, image), ...]`` in clip order.
+    """
+    import cv2
+    if mode not in VIDEO_SAMPLING_MODES:
+        raise ValueError(f"Unknown video sampling mode: {mode}")
+
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        if not cap.isOpened():
+            raise Exception("Could not read video file")
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0
+
+        if frame_count <= 0:
+            # Some containers do not report a frame count; fall back to the first frame
+            ret, frame = cap.read()
+            if not ret:
+                raise Exception("Could not read video file")
+            return [(0.0, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))]
+
+        if mode == 'scene':
+            candidates = _evenly_spaced(frame_count, num_frames * SCENE_CANDIDATES_PER_FRAME)
+        else:
+            candidates = _evenly_spaced(frame_count, num_frames)
+
+        frames = []
+        for frame_index in candidates:
+            image = _read_frame_at(cap, frame_index)
+            if image is not None:
+                image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+                frames.append((frame_index, image))
+        if not frames:
+            raise Exception("Could not read video file")
+
+        if mode == 'scene' and len(frames) > num_frames:
+            # Score each candidate by how much it differs from the previous one
+            signatures = [_frame_signature(image) for _, image in frames]
+            scores = [float('inf')] + [
+                sum(abs(a - b) for a, b in zip(signatures[i], signatures[i - 1]))
+                for i in range(1, len(signatures))
+            ]
+            min_gap = SCENE_MIN_SPACING * frame_count / num_frames
+            keep = _pick_scene_changes([frame_index for frame_index, _ in frames], scores, num_frames, min_gap)
+            frames = [frames[i] for i in keep]
+
+        return [
+            (frame_index / fps if fps else 0.0, image)
+            for frame_index, image in frames
+        ]
+    finally:
+        cap.release()
+
+def make_contact_sheet(frames, cell_edge=CONTACT_SHEET_CELL_EDGE):
+    """Tile frames left-to-right, top-to-bottom into a single RGB image."""
+    images = []
+    for frame in frames:
+        frame = _to_rgb(frame)
+        if max(frame.size) > cell_edge:
+            frame = frame.copy()
+            frame.thumbnail((cell_edge, cell_edge), Image.Resampling.LANCZOS)
+        images.append(frame)
+
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    cell_width = max(img.width for img in images)
+    cell_height = max(img.height for img in images)
+
+    sheet = Image.new('RGB', (columns * cell_width, rows * cell_height), (0, 0, 0))
+    for i, img in enumerate(images):
+        sheet.paste(img, ((i % columns) * cell_width, (i // columns) * cell_height))
+    return sheet
+
+def probe_media(path):
+    """Read a media file's type, dimensions and timing without decoding it.
+
+    Uses one libmagic call for the MIME type, the image header (honouring
+    EXIF rotation) for image dimensions, and OpenCV's container properties
+    for videos. Returns a dict keyed by MEDIA_PROBE_COLUMNS; values that
+    cannot be read are None. ``bitrate`` is in bits per second.
+    """
+    import magic
+    path = str(path)
+    probe = dict.fromkeys(MEDIA_PROBE_COLUMNS)
+    probe['file_size'] = os.path.getsize(path)
+
+    try:
+        probe['mime_type'] = magic.from_file(path, mime=True)
+    except Exception as e:
+        print(f"Could not detect the type of {path}: {e}")
+    if not (probe['mime_type'] or '').startswith(('image/', 'video/')):
+        # libmagic reports some containers as application/octet-stream
+        probe['mime_type'] = mimetypes.guess_type(path)[0] or probe['mime_type']
+
+    if (probe['mime_type'] or '').startswith('video/'):
+        import cv2
+        cap = cv2.VideoCapture(path)
+        try:
+            if cap.isOpened():
+                probe['width'] = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or None
+                probe['height'] = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or None
+                fps = cap.get(cv2.CAP_PROP_FPS)
+                frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+                if fps > 0:
+                    probe['fps'] = round(fps, 3)
+                    if frame_count > 0:
+                        probe['duration'] = round(frame_count / fps, 3)
+                        probe['bitrate'] = int(probe['file_size'] * 8 / probe['duration'])
+        finally:
+            cap.release()
+    else:
+        try:
+            with Image.open(path) as img:
+                width, height = img.size
+                if img.getexif().get(_EXIF_ORIENTATION_TAG) in _EXIF_TRANSPOSED_ORIENTATIONS:
+                    width, height = height, width
+                probe['width'], probe['height'] = width, height
+        except OSError as e:
+            print(f"Could not read the dimensions of {path}: {e}")
+    return probe
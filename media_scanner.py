@@ -0,0 +1,123 @@
+import os
+import threading
+
+from db import get_database, DB_PATH
+from migrations import migrate
+
+def iter_media_files(root, extensions):
+    """Walk a directory tree lazily, yielding ``os.DirEntry`` objects for files
+    whose lowercase suffix is in ``extensions``.
+
+    Hidden files and directories are skipped and directory symlinks are not
+    followed, so a library with link loops cannot recurse forever.
+    """
+    stack = [os.path.abspath(root)]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                            yield entry
+                    except OSError:
+                        continue
+        except (PermissionError, FileNotFoundError, NotADirectoryError) as e:
+            print(f"Skipping {directory}: {e}")
+
+class ScanIndex:
+    """Persistent (path, size, mtime) index of files that were already analyzed.
+
+    Lives in the ``scan_index`` table of the content database. A file whose
+    size and modification time match its index entry, and whose entry was
+    written at the current analysis version, can be skipped without being
+    hashed or sent to Gemini.
+    """
+
+    def __init__(self, analysis_version, db_path=DB_PATH):
+        self.analysis_version = analysis_version
+        self.db = get_database(db_path)
+        self._entries = None
+        self._lock = threading.Lock()
+        # scan_index is created by migrations.py
+        migrate(self.db)
+
+    def _load(self):
+        """Load the whole index once; a 100k-row index is a few MB in memory."""
+        if self._entries is None:
+            with self.db.read() as conn:
+                self._entries = {
+                    path: (size, mtime_ns, file_hash)
+                    for path, size, mtime_ns, file_hash in conn.execute('''
+                    SELECT path, size, mtime_ns, file_hash FROM scan_index
+                    WHERE analysis_version = ?
+                    ''', (self.analysis_version,))
+                }
+        return self._entries
+
+    def lookup(self, path, size, mtime_ns):
+        """Return the indexed content hash if the file is unchanged, else None."""
+        with self._lock:
+            entry = self._load().get(os.path.abspath(path))
+        if entry and entry[0] == size and entry[1] == mtime_ns:
+            return entry[2]
+        return None
+
+    def record(self, path, size, mtime_ns, file_hash):
+        """Mark a file as analyzed at its current size and mtime."""
+        path = os.path.abspath(path)
+        with self._lock:
+            with self.db.write() as conn:
+                conn.execute('''
+                INSERT OR REPLACE INTO scan_index (path, size, mtime_ns, file_hash, analysis_version)
+                VALUES (?, ?, ?, ?, ?)
+                ''', (path, size, mtime_ns, file_hash, self.analysis_version))
+            if self._entries is not None:
+                self._entries[path] = (size, mtime_ns, file_hash)
+
+    def clear(self):
+        """Forget every indexed file so the next scan re-checks everything."""
+        with self._lock:
+            with self.db.write() as conn:
+                deleted = conn.execute('DELETE FROM scan_index').rowcount
+            self._entries = None
+        return deleted
+
+class MediaScanner:
+    """Incremental scanner that yields only new or changed media files.
+
+    ``scan`` remembers the size and mtime each yielded file had when it was
+    scanned; call ``mark_analyzed`` once the file's analysis is saved so it
+    is skipped next time. Unchanged files are collected in ``skipped`` as
+    ``(path, file_hash)`` pairs.
+    """
+
+    def __init__(self, index, extensions):
+        self.index = index
+        self.extensions = extensions
+        self.skipped = []
+        self._scanned = {}
+
+    def scan(self, root):
+        """Yield paths under ``root`` that are not in the index at their current size and mtime."""
+        for entry in iter_media_files(root, self.extensions):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            file_hash = self.index.lookup(entry.path, stat.st_size, stat.st_mtime_ns)
+            if file_hash is not None:
+                self.skipped.append((entry.path, file_hash))
+                continue
+            self._scanned[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            yield entry.path
+
+    def mark_analyzed(self, path, file_hash):
+        """Record a scanned file in the index using the stat taken at scan time."""
+        stat = self._scanned.pop(os.fspath(path), None)
+        if stat:
+            self.index.record(path, stat[0], stat[1], file_hash)
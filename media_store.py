@@ -0,0 +1,262 @@
+import os
+import sys
+import uuid
+import shutil
+import hashlib
+import argparse
+import time
+from pathlib import Path
+
+from db import get_database, DB_PATH
+from migrations import migrate as migrate_schema
+
+# Directory holding content-addressed media blobs
+MEDIA_STORE_DIR = os.getenv('MEDIA_STORE_DIR', 'media_store')
+# Unreferenced blobs younger than this are kept: uploads are stored before
+# their analysis row is saved, and manually created posts only reference
+# their media from the Streamlit session
+GC_GRACE_SECONDS = 7 * 24 * 3600
+
+# Read size used when hashing or copying media files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def compute_file_hash(file_path, chunk_size=HASH_CHUNK_SIZE):
+    """Compute the md5 content hash of a file without loading it into memory."""
+    file_hash = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def save_and_hash(source, dest_path, chunk_size=HASH_CHUNK_SIZE):
+    """Stream a binary file object to dest_path in chunks, hashing it in the same pass.
+
+    Memory use is bounded by chunk_size regardless of the file size. The data
+    is written to a temporary file first so dest_path never holds a partial
+    copy. Returns the same md5 hash as compute_file_hash.
+    """
+    file_hash = hashlib.md5()
+    dest_path = Path(dest_path)
+    partial_path = dest_path.with_name(dest_path.name + '.part')
+    try:
+        with open(partial_path, 'wb') as f:
+            for chunk in iter(lambda: source.read(chunk_size), b''):
+                file_hash.update(chunk)
+                f.write(chunk)
+        os.replace(partial_path, dest_path)
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        raise
+    return file_hash.hexdigest()
+
+def _reflink(source, dest):
+    """Clone a file copy-on-write where the filesystem supports it (Btrfs, XFS, APFS)."""
+    if sys.platform.startswith('linux'):
+        import fcntl
+        FICLONE = 0x40049409
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return True
+            except OSError:
+                pass
+        os.unlink(dest)
+    elif sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if hasattr(libc, 'clonefile'):
+            return libc.clonefile(os.fsencode(source), os.fsencode(dest), 0) == 0
+    return False
+
+def link_or_copy(source, dest):
+    """Place source at dest without duplicating data where possible.
+
+    Tries a copy-on-write reflink first, then a hardlink (the blob then
+    shares the original's inode, so the original must not be edited in
+    place), and finally a regular copy. Returns the method used.
+    """
+    if _reflink(source, dest):
+        return 'reflink'
+    try:
+        os.link(source, dest)
+        return 'hardlink'
+    except OSError:
+        shutil.copy2(source, dest)
+        return 'copy'
+def blob_hash(path, root=MEDIA_STORE_DIR):
+    """Content hash of a blob in the store, read from its name.
+
+    Returns None for paths outside the store, so callers can fall back to
+    hashing the file.
+    """
+    path = Path(path)
+    try:
+        relative = path.resolve().relative_to(Path(root).resolve())
+    except ValueError:
+        return None
+    file_hash = path.stem
+    if (len(relative.parts) != 2 or relative.parts[0] != file_hash[:2] or len(file_hash) != 32
+            or any(c not in '0123456789abcdef' for c in file_hash)):
+        return None
+    return file_hash
+
+class MediaStore:
+    """Media files stored once per content hash.
+
+    Blobs live at ``<root>/<hash[:2]>/<hash><suffix>`` and are registered in
+    the ``media_blobs`` table. A blob's reference count is the number of
+    ``content_analysis`` rows whose ``file_path`` points at it; ``gc``
+    deletes only blobs with no references.
+    """
+
+    def __init__(self, root=MEDIA_STORE_DIR, db_path=DB_PATH):
+        self.root = Path(root)
+        self.db = get_database(db_path)
+        (self.root / 'tmp').mkdir(parents=True, exist_ok=True)
+        # media_blobs is created by migrations.py
+        migrate_schema(self.db)
+
+    def path_for(self, file_hash, suffix):
+        """Location of the blob for a content hash and file extension."""
+        return self.root / file_hash[:2] / f"{file_hash}{suffix.lower()}"
+
+    def contains(self, path):
+        """Check whether a path points into the store."""
+        try:
+            Path(path).resolve().relative_to(self.root.resolve())
+            return True
+        except ValueError:
+            return False
+
+    def _register(self, blob_path, file_hash):
+        """Record a blob, refreshing added_at so gc's grace period restarts."""
+        with self.db.write() as conn:
+            conn.execute('''
+            INSERT OR REPLACE INTO media_blobs (path, file_hash, size) VALUES (?, ?, ?)
+            ''', (str(blob_path), file_hash, blob_path.stat().st_size))
+
+    def add_stream(self, source, suffix):
+        """Store a binary file object, streaming and hashing it in one pass.
+
+        Returns ``(blob_path, file_hash)``. Content that is already stored is
+        not written twice.
+        """
+        tmp_path = self.root / 'tmp' / uuid.uuid4().hex
+        file_hash = save_and_hash(source, tmp_path)
+        blob_path = self.path_for(file_hash, suffix)
+        if blob_path.exists():
+            tmp_path.unlink()
+        else:
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, blob_path)
+        self._register(blob_path, file_hash)
+        return blob_path, file_hash
+
+    def add_file(self, path, file_hash=None):
+        """Store an existing file by reflink, hardlink or copy.
+
+        Returns ``(blob_path, file_hash)``.
+        """
+        path = Path(path)
+        if file_hash is None:
+            file_hash = compute_file_hash(path)
+        blob_path = self.path_for(file_hash, path.suffix)
+        if not blob_path.exists():
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.root / 'tmp' / uuid.uuid4().hex
+            link_or_copy(path, tmp_path)
+            os.replace(tmp_path, blob_path)
+        self._register(blob_path, file_hash)
+        return blob_path, file_hash
+
+    def reference_counts(self):
+        """Map each registered blob path to ``(references, added_at)``."""
+        with self.db.read() as conn:
+            has_analyses = conn.execute('''
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_analysis'
+            ''').fetchone()
+            if not has_analyses:
+                return {
+                    path: (0, added_at)
+                    for path, added_at in conn.execute('SELECT path, added_at FROM media_blobs')
+                }
+            return {
+                path: (references, added_at)
+                for path, references, added_at in conn.execute('''
+                SELECT b.path, COUNT(ca.id), b.added_at
+                FROM media_blobs b
+                LEFT JOIN content_analysis ca ON ca.file_path = b.path
+                GROUP BY b.path
+                ''')
+            }
+
+    def gc(self, grace_seconds=GC_GRACE_SECONDS, dry_run=False):
+        """Delete blobs no analysis references, plus abandoned partial uploads.
+
+        Blobs stored within the last ``grace_seconds`` are kept even when
+        unreferenced. Returns the list of removed (or, with ``dry_run``,
+        removable) paths.
+        """
+        cutoff = time.time() - grace_seconds
+        cutoff_timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(cutoff))
+        removed = []
+        for path, (references, added_at) in self.reference_counts().items():
+            if references or added_at > cutoff_timestamp:
+                continue
+            removed.append(path)
+            if not dry_run:
+                Path(path).unlink(missing_ok=True)
+                with self.db.write() as conn:
+                    conn.execute('DELETE FROM media_blobs WHERE path = ?', (path,))
+
+        for tmp_path in (self.root / 'tmp').iterdir():
+            if tmp_path.stat().st_mtime < cutoff:
+                removed.append(str(tmp_path))
+                if not dry_run:
+                    tmp_path.unlink(missing_ok=True)
+        return removed
+
+    def migrate(self):
+        """Move files referenced by existing analyses into the store.
+
+        Each analysis whose ``file_path`` exists outside the store is linked
+        in and repointed at its blob, so duplicate copies (such as the old
+        ``temp/`` files) stop being referenced. Returns the number of
+        analyses updated.
+        """
+        with self.db.read() as conn:
+            rows = conn.execute('SELECT id, file_path FROM content_analysis').fetchall()
+        updated = 0
+        for analysis_id, file_path in rows:
+            if not file_path or self.contains(file_path) or not Path(file_path).is_file():
+                continue
+            blob_path, _ = self.add_file(file_path)
+            with self.db.write() as conn:
+                conn.execute('''
+                UPDATE content_analysis SET file_path = ? WHERE id = ?
+                ''', (str(blob_path), analysis_id))
+            updated += 1
+        return updated
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the content-addressed media store")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Link files referenced by existing analyses into the store")
+    parser.add_argument('--gc', action='store_true',
+                        help="Delete stored media that no analysis references")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="With --gc, list what would be deleted without deleting it")
+    args = parser.parse_args()
+
+    store = MediaStore()
+    if args.migrate:
+        print(f"Moved {store.migrate()} analyses into {store.root}")
+    if args.gc:
+        removed = store.gc(dry_run=args.dry_run)
+        action = "Would remove" if args.dry_run else "Removed"
+        for path in removed:
+            print(f"{action} {path}")
+        print(f"{action} {len(removed)} unreferenced files")
+
+if __name__ == "__main__":
+    main()
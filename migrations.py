@@ -0,0 +1,453 @@
+import time
+import logging
+import argparse
+import threading
+
+from db import get_database
+
+logger = logging.getLogger(__name__)
+
+# content_analysis column holding each category's score, alongside the
+# category_scores rows, so analyses can be filtered and sorted by category
+CATEGORY_SCORE_COLUMNS = {
+    "Cuteness Factor": "cuteness_score",
+    "Action/Entertainment Value": "entertainment_score",
+    "Uniqueness": "uniqueness_score",
+    "Image/Video Quality": "quality_score",
+    "Trend Alignment": "trend_score"
+}
+
+# Rows updated per write transaction by chunked backfills
+BACKFILL_CHUNK_SIZE = 500
+# Seconds a backfill sleeps between chunks so other writers get the lock
+BACKFILL_PAUSE_SECONDS = 0.05
+
+def _add_columns(conn, table, columns):
+    """Add ``(name, type)`` columns that the table does not have yet."""
+    for column, column_type in columns:
+        exists = conn.execute('''
+        SELECT COUNT(*) FROM pragma_table_info(?) WHERE name=?
+        ''', (table, column)).fetchone()[0]
+        if not exists:
+            conn.execute(f'''
+            ALTER TABLE {table} ADD COLUMN {column} {column_type}
+            ''')
+
+def backfill(db, table, assignments, where, params=(), chunk_size=BACKFILL_CHUNK_SIZE,
+             pause=BACKFILL_PAUSE_SECONDS):
+    """Run ``UPDATE table SET assignments`` over rows matching ``where`` in chunks.
+
+    Each chunk is its own short write transaction, so a backfill over a
+    large live database never holds the write lock for long, and an
+    interrupted backfill picks up where it stopped when run again. ``where``
+    must stop matching a row once it has been updated (``new_column IS
+    NULL`` is typical). ``params`` fill the placeholders of ``assignments``
+    and then ``where``. Returns the number of rows updated.
+    """
+    total = 0
+    while True:
+        with db.write() as conn:
+            updated = conn.execute(f'''
+            UPDATE {table} SET {assignments}
+            WHERE rowid IN (SELECT rowid FROM {table} WHERE {where} LIMIT ?)
+            ''', (*params, chunk_size)).rowcount
+        total += updated
+        if updated < chunk_size:
+            return total
+        time.sleep(pause)
+
+def _create_content_tables(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS content_analysis (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT,
+        original_filename TEXT,
+        media_type TEXT,
+        total_score INTEGER,
+        caption TEXT,
+        hashtags TEXT,
+        engagement_tips TEXT,
+        key_strengths TEXT,
+        improvement_suggestions TEXT,
+        timestamp DATETIME,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS category_scores (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        analysis_id INTEGER,
+        category TEXT,
+        score INTEGER,
+        FOREIGN KEY (analysis_id) REFERENCES content_analysis (id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS posting_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        analysis_id INTEGER,
+        platform TEXT,
+        status TEXT,
+        posted_at DATETIME,
+        error_message TEXT,
+        updated_at DATETIME,
+        FOREIGN KEY (analysis_id) REFERENCES content_analysis (id)
+    )
+    ''')
+
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS engagement_metrics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        post_id INTEGER,
+        platform TEXT,
+        likes INTEGER DEFAULT 0,
+        comments INTEGER DEFAULT 0,
+        shares INTEGER DEFAULT 0,
+        views INTEGER DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (post_id) REFERENCES content_analysis (id)
+    )
+    ''')
+
+    # Token usage and latency of every Gemini call; a batched call is
+    # shared by media_count analyses
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS gemini_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        request_type TEXT,
+        model TEXT,
+        media_count INTEGER DEFAULT 1,
+        prompt_tokens INTEGER,
+        output_tokens INTEGER,
+        cached_tokens INTEGER,
+        total_tokens INTEGER,
+        latency_ms INTEGER,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _add_analysis_cache_columns(conn):
+    # usage_id links an analysis to its Gemini call
+    _add_columns(conn, 'content_analysis', [
+        ('file_hash', 'TEXT'), ('analysis_version', 'INTEGER'), ('usage_id', 'INTEGER')
+    ])
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_content_analysis_file_hash
+    ON content_analysis(file_hash)
+    ''')
+
+def _add_perceptual_hash_columns(conn):
+    _add_columns(conn, 'content_analysis', [
+        ('phash', 'TEXT'), ('dhash', 'TEXT'), ('near_duplicate_of', 'INTEGER')
+    ])
+
+def _add_media_probe_columns(conn):
+    _add_columns(conn, 'content_analysis', [
+        ('mime_type', 'TEXT'), ('width', 'INTEGER'), ('height', 'INTEGER'),
+        ('duration', 'REAL'), ('fps', 'REAL'), ('bitrate', 'INTEGER'), ('file_size', 'INTEGER')
+    ])
+
+def _add_query_indexes(conn):
+    # Due posts polled by the scheduler
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_posting_history_status_posted_at
+    ON posting_history(status, posted_at)
+    ''')
+    # Posting history of one analysis
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_posting_history_analysis_id
+    ON posting_history(analysis_id)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_category_scores_analysis_id
+    ON category_scores(analysis_id)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_engagement_metrics_post_platform
+    ON engagement_metrics(post_id, platform)
+    ''')
+    # Duplicate upload check in the control center
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_content_analysis_original_filename
+    ON content_analysis(original_filename)
+    ''')
+
+def _add_category_score_columns(conn):
+    _add_columns(conn, 'content_analysis', [
+        (column, 'INTEGER') for column in CATEGORY_SCORE_COLUMNS.values()
+    ])
+    for column in ('total_score', *CATEGORY_SCORE_COLUMNS.values()):
+        conn.execute(f'''
+        CREATE INDEX IF NOT EXISTS idx_content_analysis_{column}
+        ON content_analysis({column})
+        ''')
+
+def _backfill_category_scores(db):
+    """Copy scores from category_scores into the per-category columns."""
+    updated = 0
+    for category, column in CATEGORY_SCORE_COLUMNS.items():
+        score = '''
+        SELECT score FROM category_scores
+        WHERE analysis_id = content_analysis.id AND category = ? AND score IS NOT NULL
+        '''
+        updated += backfill(
+            db, 'content_analysis', f'{column} = ({score} ORDER BY id LIMIT 1)',
+            f'{column} IS NULL AND EXISTS ({score})', (category, category)
+        )
+    return updated
+
+# SQL expression converting a datetime string (any format SQLite's date
+# functions accept, including "+00:00" offsets) to UTC epoch milliseconds
+_EPOCH_MS_SQL = "CAST(ROUND((julianday({0}) - 2440587.5) * 86400000) AS INTEGER)"
+
+def _add_posted_at_ms(conn):
+    _add_columns(conn, 'posting_history', [('posted_at_ms', 'INTEGER')])
+    # Superseded by the indexes on posted_at_ms below
+    for index in ('idx_posting_history_status_posted_at', 'idx_posting_history_analysis_id'):
+        conn.execute(f'DROP INDEX IF EXISTS {index}')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_posting_history_status_posted_at_ms
+    ON posting_history(status, posted_at_ms)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_posting_history_analysis_posted_at_ms
+    ON posting_history(analysis_id, posted_at_ms)
+    ''')
+    # Keep posted_at_ms in step for writers that only set posted_at (such as
+    # processes still running the previous version)
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS posting_history_posted_at_ms_insert
+    AFTER INSERT ON posting_history
+    WHEN NEW.posted_at_ms IS NULL AND julianday(NEW.posted_at) IS NOT NULL
+    BEGIN
+        UPDATE posting_history
+        SET posted_at_ms = {_EPOCH_MS_SQL.format('NEW.posted_at')}, posted_at = datetime(NEW.posted_at)
+        WHERE id = NEW.id;
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS posting_history_posted_at_ms_update
+    AFTER UPDATE OF posted_at ON posting_history
+    WHEN NEW.posted_at IS NOT OLD.posted_at AND NEW.posted_at_ms IS OLD.posted_at_ms
+        AND julianday(NEW.posted_at) IS NOT NULL
+    BEGIN
+        UPDATE posting_history
+        SET posted_at_ms = {_EPOCH_MS_SQL.format('NEW.posted_at')}, posted_at = datetime(NEW.posted_at)
+        WHERE id = NEW.id;
+    END
+    ''')
+
+def _backfill_posted_at_ms(db):
+    """Convert existing posted_at strings to epoch milliseconds and one UTC format."""
+    return backfill(
+        db, 'posting_history',
+        f"posted_at_ms = {_EPOCH_MS_SQL.format('posted_at')}, posted_at = datetime(posted_at)",
+        'posted_at_ms IS NULL AND julianday(posted_at) IS NOT NULL'
+    )
+
+# content_analysis columns indexed for full-text search, in the order of the
+# columns of content_analysis_fts
+SEARCH_COLUMNS = ('original_filename', 'caption', 'hashtags', 'key_strengths', 'engagement_tips')
+
+def _add_content_search(conn):
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f'NEW.{column}' for column in SEARCH_COLUMNS)
+    old_values = ', '.join(f'OLD.{column}' for column in SEARCH_COLUMNS)
+    # External content table: the text stays in content_analysis and the
+    # triggers below keep the index in step with it. Prefix indexes make
+    # search-as-you-type prefix queries cheap.
+    conn.execute(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS content_analysis_fts USING fts5(
+        {columns},
+        content='content_analysis',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS content_analysis_fts_insert
+    AFTER INSERT ON content_analysis
+    BEGIN
+        INSERT INTO content_analysis_fts (rowid, {columns}) VALUES (NEW.id, {new_values});
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS content_analysis_fts_delete
+    AFTER DELETE ON content_analysis
+    BEGIN
+        INSERT INTO content_analysis_fts (content_analysis_fts, rowid, {columns})
+        VALUES ('delete', OLD.id, {old_values});
+    END
+    ''')
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS content_analysis_fts_update
+    AFTER UPDATE OF {columns} ON content_analysis
+    BEGIN
+        INSERT INTO content_analysis_fts (content_analysis_fts, rowid, {columns})
+        VALUES ('delete', OLD.id, {old_values});
+        INSERT INTO content_analysis_fts (rowid, {columns}) VALUES (NEW.id, {new_values});
+    END
+    ''')
+    # Index the existing analyses in the same transaction as the triggers,
+    # so no row is missed or indexed twice
+    conn.execute("INSERT INTO content_analysis_fts (content_analysis_fts) VALUES ('rebuild')")
+
+def _create_scan_index(conn):
+    # Files already analyzed, by path, size and mtime (see media_scanner.ScanIndex)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS scan_index (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        file_hash TEXT,
+        analysis_version INTEGER,
+        indexed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+def _create_analysis_jobs(conn):
+    # Persistent analysis queue (see job_queue.AnalysisJobQueue)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS analysis_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        analysis_id INTEGER,
+        error_message TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (analysis_id) REFERENCES content_analysis (id)
+    )
+    ''')
+    # Queues created before jobs were leased and retried lack these
+    _add_columns(conn, 'analysis_jobs', [
+        ('attempts', 'INTEGER NOT NULL DEFAULT 0'),
+        ('lease_owner', 'TEXT'),
+        ('lease_expires_at', 'INTEGER'),
+        ('available_at', 'INTEGER NOT NULL DEFAULT 0')
+    ])
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status
+    ON analysis_jobs(status, id)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_analysis_jobs_file_path
+    ON analysis_jobs(file_path, status)
+    ''')
+
+def _create_media_blobs(conn):
+    # Content-addressed uploads (see media_store.MediaStore)
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS media_blobs (
+        path TEXT PRIMARY KEY,
+        file_hash TEXT NOT NULL,
+        size INTEGER,
+        added_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_media_blobs_file_hash
+    ON media_blobs(file_hash)
+    ''')
+
+# Schema history as ``(version, name, apply, backfill)``. ``apply(conn)`` runs
+# in one write transaction; the optional ``backfill(db)`` runs afterwards in
+# chunks (see ``backfill``) and the version is recorded once it finishes.
+# Every step must be safe to run again: databases created before migrations
+# existed already have some of these columns. Append new migrations with the
+# next version number and never edit applied ones.
+MIGRATIONS = [
+    (1, 'Create content tables', _create_content_tables, None),
+    (2, 'Add analysis cache columns', _add_analysis_cache_columns, None),
+    (3, 'Add perceptual hash columns', _add_perceptual_hash_columns, None),
+    (4, 'Add media probe columns', _add_media_probe_columns, None),
+    (5, 'Index hot queries', _add_query_indexes, None),
+    (6, 'Add per-category score columns', _add_category_score_columns, _backfill_category_scores),
+    (7, 'Add epoch-millisecond posted_at', _add_posted_at_ms, _backfill_posted_at_ms),
+    (8, 'Add full-text search over analyses', _add_content_search, None),
+    (9, 'Create scan index', _create_scan_index, None),
+    (10, 'Create analysis job queue', _create_analysis_jobs, None),
+    (11, 'Create media store table', _create_media_blobs, None),
+]
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+def applied_versions(db):
+    """Versions already recorded in schema_migrations."""
+    with db.write() as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+        return {version for (version,) in conn.execute('SELECT version FROM schema_migrations')}
+
+def migrate(db=None):
+    """Apply pending migrations in order; returns the versions applied.
+
+    Safe to call from every process at startup: each migration re-checks
+    its version inside its own write transaction, so concurrent callers
+    apply it once. Later calls in the same process return immediately.
+    """
+    db = db or get_database()
+    with _migrated_lock:
+        if db.db_path in _migrated:
+            return []
+
+        applied = applied_versions(db)
+        newly_applied = []
+        for version, name, apply, backfill_rows in MIGRATIONS:
+            if version in applied:
+                continue
+            with db.write() as conn:
+                if conn.execute('''
+                SELECT 1 FROM schema_migrations WHERE version = ?
+                ''', (version,)).fetchone():
+                    continue
+                apply(conn)
+                if backfill_rows is None:
+                    conn.execute('''
+                    INSERT INTO schema_migrations (version, name) VALUES (?, ?)
+                    ''', (version, name))
+            if backfill_rows is not None:
+                updated = backfill_rows(db)
+                logger.info(f"Migration {version} backfilled {updated} rows")
+                with db.write() as conn:
+                    conn.execute('''
+                    INSERT OR IGNORE INTO schema_migrations (version, name) VALUES (?, ?)
+                    ''', (version, name))
+            logger.info(f"Applied migration {version}: {name}")
+            newly_applied.append(version)
+
+        if newly_applied:
+            # Refresh the query planner's statistics for the new indexes
+            with db.write() as conn:
+                conn.execute('PRAGMA optimize')
+        _migrated.add(db.db_path)
+        return newly_applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument('--status', action='store_true',
+                        help="List migrations and whether they are applied, without applying any")
+    args = parser.parse_args()
+
+    db = get_database()
+    if args.status:
+        applied = applied_versions(db)
+        for version, name, _, _ in MIGRATIONS:
+            print(f"{'applied' if version in applied else 'pending':>8}  {version:>3}  {name}")
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    newly_applied = migrate(db)
+    print(f"Applied {len(newly_applied)} migrations" if newly_applied else "Database is up to date")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import threading
+import numpy as np
+from PIL import Image, ImageOps
+
+# Side of the low-frequency DCT block used for pHash (64-bit hashes)
+PHASH_SIZE = 8
+# Images are shrunk to this size before the DCT
+PHASH_IMAGE_SIZE = 32
+# Width of the gradient grid used for dHash (64-bit hashes)
+DHASH_SIZE = 8
+
+def _grayscale_pixels(img, size):
+    """Shrink an image to ``size`` and return its grayscale pixels as floats."""
+    img = img.convert('L').resize(size, Image.Resampling.LANCZOS)
+    return np.asarray(img, dtype=np.float64)
+
+def _pack_bits(bits):
+    """Pack a boolean array into an integer, most significant bit first."""
+    return int.from_bytes(np.packbits(bits.flatten()).tobytes(), 'big')
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II matrix, so ``D @ x @ D.T`` is the 2-D DCT of ``x``."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+_DCT = _dct_matrix(PHASH_IMAGE_SIZE)
+
+def phash(img):
+    """64-bit perceptual hash: the low-frequency DCT coefficients above their median."""
+    pixels = _grayscale_pixels(img, (PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE))
+    low_frequencies = (_DCT @ pixels @ _DCT.T)[:PHASH_SIZE, :PHASH_SIZE]
+    return _pack_bits(low_frequencies > np.median(low_frequencies))
+
+def dhash(img):
+    """64-bit difference hash: whether each pixel is brighter than its right neighbour."""
+    pixels = _grayscale_pixels(img, (DHASH_SIZE + 1, DHASH_SIZE))
+    return _pack_bits(pixels[:, 1:] > pixels[:, :-1])
+
+def image_hashes(path):
+    """Compute ``(phash, dhash)`` for an image file.
+
+    JPEGs are decoded in draft mode at a fraction of their size, since the
+    hashes only look at a 32x32 thumbnail.
+    """
+    with Image.open(path) as img:
+        if img.format == 'JPEG':
+            img.draft('RGB', (PHASH_IMAGE_SIZE * 4, PHASH_IMAGE_SIZE * 4))
+        img = ImageOps.exif_transpose(img)
+        return phash(img), dhash(img)
+
+def hamming_distance(a, b):
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count('1')
+
+def hash_to_hex(value):
+    """Store 64-bit hashes as hex text; SQLite integers are signed."""
+    return f"{value:016x}"
+
+class BKTree:
+    """Burkhard-Keller tree for Hamming-distance lookups over integer hashes.
+
+    Each child edge is labelled with its distance to the parent, so by the
+    triangle inequality a search only descends into children whose label
+    is within ``max_distance`` of the query's distance to the parent.
+    """
+
+    def __init__(self):
+        self._root = None  # [hash, items, {distance: child}]
+        self.size = 0
+
+    def add(self, value, item):
+        """Add an item under a hash."""
+        self.size += 1
+        if self._root is None:
+            self._root = [value, [item], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Return ``[(distance, item), ...]`` for items within ``max_distance``, nearest first."""
+        matches = []
+        stack = [self._root] if self._root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+class NearDuplicateEntry:
+    """An analyzed (or currently analyzing) image in a NearDuplicateIndex."""
+
+    def __init__(self, phash, dhash, analysis_id=None, done=False):
+        self.phash = phash
+        self.dhash = dhash
+        self.analysis_id = analysis_id
+        self._done = threading.Event()
+        if done:
+            self._done.set()
+
+    @property
+    def failed(self):
+        return self._done.is_set() and self.analysis_id is None
+
+    def resolve(self, analysis_id):
+        """Publish the analysis for this image, or None if analyzing it failed."""
+        self.analysis_id = analysis_id
+        self._done.set()
+
+    def wait(self):
+        """Block until the image's analysis is saved and return its id (None on failure)."""
+        self._done.wait()
+        return self.analysis_id
+
+class NearDuplicateIndex:
+    """Find stored or in-flight analyses of perceptually similar images.
+
+    A match needs both the pHash and the dHash within ``max_distance`` bits.
+    ``claim`` either returns the nearest matching entry, or registers a new
+    pending entry that the caller owns and must ``resolve``; concurrent
+    near-duplicates then wait for that one analysis instead of each calling
+    Gemini. Callers must resolve every entry they own before waiting on
+    another, which rules out waits in a cycle.
+    """
+
+    def __init__(self, max_distance, entries=()):
+        self.max_distance = max_distance
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        for analysis_id, phash_value, dhash_value in entries:
+            entry = NearDuplicateEntry(phash_value, dhash_value, analysis_id, done=True)
+            self._tree.add(phash_value, entry)
+
+    def find(self, phash_value, dhash_value):
+        """Return the nearest matching entry that has not failed, or None."""
+        with self._lock:
+            return self._find(phash_value, dhash_value)
+
+    def _find(self, phash_value, dhash_value):
+        best = None
+        best_distance = None
+        for distance, entry in self._tree.search(phash_value, self.max_distance):
+            if entry.failed:
+                continue
+            dhash_distance = hamming_distance(dhash_value, entry.dhash)
+            if dhash_distance > self.max_distance:
+                continue
+            if best is None or distance + dhash_distance < best_distance:
+                best, best_distance = entry, distance + dhash_distance
+        return best
+
+    def claim(self, phash_value, dhash_value):
+        """Return ``(entry, owner)``; ``owner`` is True when no near-duplicate was found."""
+        with self._lock:
+            entry = self._find(phash_value, dhash_value)
+            if entry is not None:
+                return entry, False
+            entry = NearDuplicateEntry(phash_value, dhash_value)
+            self._tree.add(phash_value, entry)
+            return entry, True
@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from db import get_database, DB_PATH
+
+try:
+    from google.api_core.exceptions import ResourceExhausted, TooManyRequests
+    RATE_LIMIT_ERRORS = (ResourceExhausted, TooManyRequests)
+except ImportError:
+    RATE_LIMIT_ERRORS = ()
+
+# Gemini quotas shared by every process (Streamlit, CLI and Celery workers)
+GEMINI_RPM = float(os.getenv('GEMINI_RPM', 15))
+GEMINI_TPM = float(os.getenv('GEMINI_TPM', 1000000))
+# Tokens reserved for a request before its real usage is known
+GEMINI_ESTIMATED_TOKENS = int(os.getenv('GEMINI_ESTIMATED_TOKENS', 2000))
+# Adaptive concurrency bounds for Gemini requests in this process
+GEMINI_MIN_CONCURRENCY = int(os.getenv('GEMINI_MIN_CONCURRENCY', 1))
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', 8))
+# Requests slower than this count as a latency spike
+GEMINI_LATENCY_THRESHOLD = float(os.getenv('GEMINI_LATENCY_THRESHOLD', 30.0))
+
+# Bucket state lives next to the content database (CAT_CONTENT_DB), so every
+# process sharing that database also shares one Gemini budget
+RATE_LIMIT_DB = os.getenv(
+    'RATE_LIMIT_DB', os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), 'rate_limits.db')
+)
+
+def is_rate_limit_error(error):
+    """Check whether an exception is an HTTP 429 / quota exhausted error."""
+    if isinstance(error, RATE_LIMIT_ERRORS):
+        return True
+    # HTTP errors from other clients carry the status on the error or its response
+    status = getattr(error, 'code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 429
+
+class TokenBucketLimiter:
+    """Requests-per-minute and tokens-per-minute budgets shared across processes.
+
+    Bucket state lives in a small SQLite database and every update runs in a
+    ``BEGIN IMMEDIATE`` transaction, so all processes on the host draw from
+    the same budget. Buckets hold at most one minute of budget and refill
+    continuously.
+    """
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute, db_path=RATE_LIMIT_DB):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.db = get_database(db_path)
+        with self.db.write() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                name TEXT PRIMARY KEY,
+                requests REAL,
+                tokens REAL,
+                updated_at REAL
+            )
+            ''')
+            conn.execute('''
+            INSERT OR IGNORE INTO rate_limit_buckets (name, requests, tokens, updated_at)
+            VALUES (?, ?, ?, ?)
+            ''', (name, requests_per_minute, tokens_per_minute, time.time()))
+
+    def _refill(self, conn):
+        """Return the bucket levels after refilling for the elapsed time."""
+        requests, tokens, updated_at = conn.execute('''
+        SELECT requests, tokens, updated_at FROM rate_limit_buckets WHERE name = ?
+        ''', (self.name,)).fetchone()
+        now = time.time()
+        elapsed = max(0.0, now - updated_at)
+        requests = min(self.requests_per_minute, requests + elapsed * self.requests_per_minute / 60)
+        tokens = min(self.tokens_per_minute, tokens + elapsed * self.tokens_per_minute / 60)
+        return requests, tokens, now
+
+    def acquire(self, estimated_tokens=GEMINI_ESTIMATED_TOKENS):
+        """Block until one request and ``estimated_tokens`` tokens are available."""
+        # A single request may never need more than a full minute of tokens
+        estimated_tokens = min(estimated_tokens, self.tokens_per_minute)
+        while True:
+            with self.db.write() as conn:
+                requests, tokens, now = self._refill(conn)
+                if requests >= 1 and tokens >= estimated_tokens:
+                    requests -= 1
+                    tokens -= estimated_tokens
+                    wait = 0.0
+                else:
+                    wait = max(
+                        (1 - requests) * 60 / self.requests_per_minute,
+                        (estimated_tokens - tokens) * 60 / self.tokens_per_minute
+                    )
+                conn.execute('''
+                UPDATE rate_limit_buckets SET requests = ?, tokens = ?, updated_at = ?
+                WHERE name = ?
+                ''', (requests, tokens, now, self.name))
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    def adjust_tokens(self, delta):
+        """Correct the token bucket once a request's real usage is known.
+
+        A positive ``delta`` means the request used more tokens than were
+        reserved; the bucket may go negative, delaying later requests.
+        """
+        if not delta:
+            return
+        with self.db.write() as conn:
+            requests, tokens, now = self._refill(conn)
+            conn.execute('''
+            UPDATE rate_limit_buckets SET requests = ?, tokens = ?, updated_at = ?
+            WHERE name = ?
+            ''', (requests, tokens - delta, now, self.name))
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the number of requests in flight in this process.
+
+    Each success adds ``1 / limit`` (roughly +1 per round of requests), while a
+    rate-limit error halves the limit and a latency spike cuts it by a
+    quarter, never going outside ``[min_limit, max_limit]``. Other failures
+    leave the limit unchanged.
+    """
+
+    def __init__(self, min_limit=GEMINI_MIN_CONCURRENCY, max_limit=GEMINI_MAX_CONCURRENCY,
+                 latency_threshold=GEMINI_LATENCY_THRESHOLD):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.limit = float(min_limit)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Block until a concurrency slot is free."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency=None, rate_limited=False, succeeded=True):
+        """Free a slot and adapt the limit to how the request went."""
+        with self._condition:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(self.min_limit, self.limit * 0.5)
+            elif latency is not None and latency > self.latency_threshold:
+                self.limit = max(self.min_limit, self.limit * 0.75)
+            elif succeeded:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+class GeminiRateLimiter:
+    """Shared quota plus adaptive concurrency for Gemini requests."""
+
+    def __init__(self, requests_per_minute=GEMINI_RPM, tokens_per_minute=GEMINI_TPM,
+                 db_path=RATE_LIMIT_DB):
+        self.bucket = TokenBucketLimiter('gemini', requests_per_minute, tokens_per_minute, db_path)
+        self.concurrency = AdaptiveConcurrencyLimiter()
+
+    @contextmanager
+    def limit(self, estimated_tokens=GEMINI_ESTIMATED_TOKENS):
+        """Wait for quota and a concurrency slot around a single Gemini request.
+
+        Yields a dict; set its ``total_tokens`` to the request's real token
+        usage so the shared token budget can be corrected.
+        """
+        self.concurrency.acquire()
+        usage = {'total_tokens': None}
+        start = time.monotonic()
+        rate_limited = succeeded = False
+        try:
+            self.bucket.acquire(estimated_tokens)
+            start = time.monotonic()
+            yield usage
+            succeeded = True
+        except Exception as e:
+            rate_limited = is_rate_limit_error(e)
+            raise
+        finally:
+            self.concurrency.release(time.monotonic() - start, rate_limited, succeeded)
+            if usage['total_tokens'] is not None:
+                self.bucket.adjust_tokens(usage['total_tokens'] - estimated_tokens)
+
+_gemini_rate_limiter = None
+_gemini_rate_limiter_lock = threading.Lock()
+
+def get_gemini_rate_limiter():
+    """Get the process-wide Gemini rate limiter."""
+    global _gemini_rate_limiter
+    with _gemini_rate_limiter_lock:
+        if _gemini_rate_limiter is None:
+            _gemini_rate_limiter = GeminiRateLimiter()
+        return _gemini_rate_limiter
@@ -0,0 +1,127 @@
+import re
+
+from db import get_database
+from migrations import CATEGORY_SCORE_COLUMNS
+
+# Ids bound per IN (...) query; well below SQLite's host parameter limit
+IN_CLAUSE_CHUNK_SIZE = 500
+# Analyses per page of find_content results
+CONTENT_PAGE_SIZE = 20
+# bm25 weight of each SEARCH_COLUMNS column; matches in captions and
+# hashtags rank above matches in the longer insight texts
+SEARCH_COLUMN_WEIGHTS = (2.0, 3.0, 3.0, 1.0, 1.0)
+# Columns of each find_content result, before 'snippet'
+CONTENT_COLUMNS = (
+    'id', 'original_filename', 'media_type', 'total_score', 'caption',
+    'hashtags', 'file_path', 'file_hash', 'created_at', *CATEGORY_SCORE_COLUMNS.values()
+)
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching every word, the last as a prefix.
+
+    Words are quoted, so FTS5 syntax characters in user input (such as the
+    ``#`` of a hashtag) are never interpreted. Returns None when the text has
+    no words.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+def _chunks(values, size=IN_CLAUSE_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+class ContentRepository:
+    """Batched reads of posting history and engagement metrics.
+
+    Pages in the control center render many analyses or posts at once.
+    Each lookup here takes every id on the page and answers with one
+    ``IN (...)`` query (per ``IN_CLAUSE_CHUNK_SIZE`` ids), returning a dict
+    to look the rows up in while rendering, instead of querying once per
+    rendered item.
+    """
+
+    def __init__(self, db=None):
+        self.db = db or get_database()
+
+    def posting_history_by_analysis(self, analysis_ids):
+        """Map each analysis id to its ``(platform, status, posted_at)`` rows, newest first.
+
+        Analyses that were never scheduled or posted map to an empty list.
+        """
+        analysis_ids = {analysis_id for analysis_id in analysis_ids if analysis_id is not None}
+        history = {analysis_id: [] for analysis_id in analysis_ids}
+        with self.db.read() as conn:
+            for chunk in _chunks(analysis_ids):
+                placeholders = ', '.join('?' * len(chunk))
+                rows = conn.execute(f'''
+                SELECT analysis_id, platform, status, posted_at
+                FROM posting_history
+                WHERE analysis_id IN ({placeholders})
+                ORDER BY posted_at_ms DESC
+                ''', chunk)
+                for analysis_id, platform, status, posted_at in rows:
+                    history[analysis_id].append((platform, status, posted_at))
+        return history
+
+    def engagement_metrics_by_post(self, posts):
+        """Map ``(post_id, platform)`` pairs to their ``(likes, comments, shares, views)``.
+
+        Pairs without recorded metrics are left out.
+        """
+        posts = {(post_id, platform) for post_id, platform in posts}
+        metrics = {}
+        with self.db.read() as conn:
+            for chunk in _chunks({post_id for post_id, _ in posts}):
+                placeholders = ', '.join('?' * len(chunk))
+                rows = conn.execute(f'''
+                SELECT post_id, platform, likes, comments, shares, views
+                FROM engagement_metrics
+                WHERE post_id IN ({placeholders})
+                ORDER BY id
+                ''', chunk)
+                for post_id, platform, *counts in rows:
+                    if (post_id, platform) in posts:
+                        metrics.setdefault((post_id, platform), tuple(counts))
+        return metrics
+
+    def find_content(self, text=None, conditions=(), params=(), order_by='ca.created_at DESC',
+                     limit=CONTENT_PAGE_SIZE, offset=0):
+        """Return one page of analyses and the number of matches as ``(rows, total)``.
+
+        ``conditions`` are SQL conditions over ``content_analysis ca`` (with
+        their ``params``) that every result must meet. With ``text``, only
+        analyses whose filename, caption, hashtags, key strengths or
+        engagement tips contain all its words are returned, best matches
+        first, and ``order_by`` is ignored. Rows are dicts keyed by
+        CONTENT_COLUMNS plus ``snippet``, the best matching passage with the
+        matched words in bold (None without ``text``).
+        """
+        conditions, params = list(conditions), list(params)
+        query = fts_query(text)
+        if query:
+            source = 'content_analysis_fts JOIN content_analysis ca ON ca.id = content_analysis_fts.rowid'
+            conditions.insert(0, 'content_analysis_fts MATCH ?')
+            params.insert(0, query)
+            snippet = "snippet(content_analysis_fts, -1, '**', '**', '…', 16)"
+            weights = ', '.join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+            order_by = f'bm25(content_analysis_fts, {weights})'
+        else:
+            source = 'content_analysis ca'
+            snippet = 'NULL'
+        where = ' AND '.join(conditions) or '1'
+
+        with self.db.read() as conn:
+            total = conn.execute(f'''
+            SELECT COUNT(*) FROM {source} WHERE {where}
+            ''', params).fetchone()[0]
+            rows = conn.execute(f'''
+            SELECT {', '.join(f'ca.{column}' for column in CONTENT_COLUMNS)}, {snippet}
+            FROM {source}
+            WHERE {where}
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+            ''', [*params, limit, offset]).fetchall()
+        return [dict(zip((*CONTENT_COLUMNS, 'snippet'), row)) for row in rows], total
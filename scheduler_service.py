@@ -1,11 +1,12 @@
 import os
 from celery import Celery
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime
 import sqlite3
-import json
 from pathlib import Path
-from social_media_manager import SocialMediaManager
+from social_media_manager import SocialMediaManager, TIKTOK_MAX_DURATION_SECONDS
+from media_store import MediaStore
+from db import get_database, epoch_ms, from_epoch_ms
+from migrations import migrate
 import logging
 from typing import Dict, List, Any
 
@@ -38,18 +39,18 @@ celery_app.conf.update(
     worker_prefetch_multiplier=1
 )
 
+# Scheduled posts due within this many milliseconds are picked up early
+DUE_WINDOW_MS = 60 * 60 * 1000
+
 class SchedulerService:
     def __init__(self):
         self.social_media_manager = SocialMediaManager()
-        self.db_path = 'cat_content.db'
-        
-    def get_db_connection(self):
-        """Get a database connection."""
-        return sqlite3.connect(self.db_path)
+        self.db = get_database()
+        migrate(self.db)
 
     def get_pending_posts(self) -> List[Dict[str, Any]]:
         """Get all pending posts from the database."""
-        with self.get_db_connection() as conn:
+        with self.db.read() as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT 
@@ -58,14 +59,16 @@ class SchedulerService:
                     ca.caption,
                     ca.hashtags,
                     ph.platform,
-                    ph.posted_at,
-                    ca.media_type
+                    ph.posted_at_ms,
+                    ca.media_type,
+                    ca.mime_type,
+                    ca.duration
                 FROM posting_history ph
                 JOIN content_analysis ca ON ph.analysis_id = ca.id
                 WHERE ph.status = 'scheduled'
-                AND datetime(ph.posted_at) <= datetime('now', '+1 hour')
-                ORDER BY ph.posted_at ASC
-            """)
+                AND ph.posted_at_ms <= ?
+                ORDER BY ph.posted_at_ms ASC
+            """, (epoch_ms() + DUE_WINDOW_MS,))
             posts = cursor.fetchall()
             
             return [{
@@ -74,13 +77,15 @@ class SchedulerService:
                 'caption': post[2],
                 'hashtags': post[3],
                 'platform': post[4],
-                'scheduled_time': post[5],
-                'media_type': post[6]
+                'scheduled_time': from_epoch_ms(post[5]),
+                'media_type': post[6],
+                'mime_type': post[7],
+                'duration': post[8]
             } for post in posts]
 
     def update_post_status(self, post_id: int, status: str, error_message: str = None):
         """Update the status of a post in the database."""
-        with self.get_db_connection() as conn:
+        with self.db.write() as conn:
             cursor = conn.cursor()
             if error_message:
                 cursor.execute("""
@@ -112,17 +117,21 @@ def process_pending_posts(self):
             success = False
             if post['platform'] == 'instagram':
                 success = scheduler.social_media_manager.post_to_instagram(
-                    post['file_path'], post['caption'], post['hashtags']
+                    post['file_path'], post['caption'], post['hashtags'],
+                    mime_type=post['mime_type']
                 )
             elif post['platform'] == 'twitter':
                 success = scheduler.social_media_manager.post_to_twitter(
-                    post['file_path'], post['caption'], post['hashtags']
+                    post['file_path'], post['caption'], post['hashtags'],
+                    mime_type=post['mime_type']
                 )
             elif post['platform'] == 'facebook':
                 success = scheduler.social_media_manager.post_to_facebook(
                     post['file_path'], post['caption'], post['hashtags']
                 )
             elif post['platform'] == 'tiktok' and post['media_type'] == 'video':
+                if post['duration'] is not None and post['duration'] > TIKTOK_MAX_DURATION_SECONDS:
+                    raise ValueError(f"Video is longer than TikTok's {TIKTOK_MAX_DURATION_SECONDS} second limit")
                 success = scheduler.social_media_manager.post_to_tiktok(
                     post['file_path'], post['caption'], post['hashtags']
                 )
@@ -146,18 +155,12 @@ def process_pending_posts(self):
 
 @celery_app.task(bind=True, name='schedule_service.cleanup_old_media')
 def cleanup_old_media(self):
-    """Celery task to clean up old media files."""
-    temp_dir = Path("temp")
-    if temp_dir.exists():
-        current_time = datetime.now()
-        for temp_file in temp_dir.glob("temp_*"):
-            try:
-                file_age = current_time - datetime.fromtimestamp(temp_file.stat().st_mtime)
-                if file_age > timedelta(days=7):  # Keep files for 7 days
-                    temp_file.unlink()
-                    logger.info(f"Cleaned up old media file: {temp_file}")
-            except Exception as e:
-                logger.error(f"Error cleaning up {temp_file}: {e}")
+    """Celery task to remove stored media that no analysis references."""
+    try:
+        for path in MediaStore().gc():
+            logger.info(f"Cleaned up unreferenced media file: {path}")
+    except Exception as e:
+        logger.error(f"Error cleaning up media store: {e}", exc_info=True)
 
 @celery_app.task(bind=True, name='schedule_service.backup_database')
 def backup_database(self):
@@ -170,8 +173,12 @@ def backup_database(self):
         backup_path = backup_dir / f"cat_content_backup_{timestamp}.db"
         
         # Create database backup
-        with sqlite3.connect('cat_content.db') as src, sqlite3.connect(str(backup_path)) as dst:
-            src.backup(dst)
+        dst = sqlite3.connect(str(backup_path))
+        try:
+            with get_database().read() as src:
+                src.backup(dst)
+        finally:
+            dst.close()
         
         # Keep only last 7 backups
         backups = sorted(backup_dir.glob("cat_content_backup_*.db"))
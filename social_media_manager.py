@@ -7,16 +7,57 @@ import magic
 import tweepy
 import streamlit as st
 import requests
+import threading
 
 from instagrapi import Client as InstagramClient
-import facebook
+import facebook as facebook_sdk
+
+# Longest video TikTok accepts, in seconds
+TIKTOK_MAX_DURATION_SECONDS = 600
+
+# Platform clients shared by every SocialMediaManager in this process, so a
+# validated Instagram session or API client is reused instead of rebuilt
+_clients = {}
+_clients_lock = threading.Lock()
 
 class SocialMediaManager:
     def __init__(self):
-        # Load credentials from environment variables
-        self.instagram = self._init_instagram()
-        self.twitter = self._init_twitter()
-        self.facebook = self._init_facebook()
+        # Clients are initialized lazily from environment variables on first
+        # use, so constructing a manager makes no network calls
+        pass
+
+    def _get_client(self, platform, init):
+        """Get a shared platform client, initializing it on first use.
+
+        Failed initializations are not cached so they are retried next time.
+        """
+        with _clients_lock:
+            if platform not in _clients:
+                client = init()
+                if client is None:
+                    return None
+                _clients[platform] = client
+            return _clients[platform]
+
+    @property
+    def instagram(self) -> Optional[InstagramClient]:
+        """Instagram client, initialized on first use."""
+        return self._get_client('instagram', self._init_instagram)
+
+    @property
+    def twitter(self) -> Optional[tweepy.Client]:
+        """Twitter API v2 client, initialized on first use."""
+        return self._get_client('twitter', self._init_twitter)
+
+    @property
+    def twitter_api(self) -> Optional[tweepy.API]:
+        """Twitter API v1.1 client used for media upload, initialized on first use."""
+        return self._get_client('twitter_api', self._init_twitter_api)
+
+    @property
+    def facebook(self) -> Optional[facebook_sdk.GraphAPI]:
+        """Facebook Graph API client, initialized on first use."""
+        return self._get_client('facebook', self._init_facebook)
 
     def _init_instagram(self) -> Optional[InstagramClient]:
         """Initialize Instagram client."""
@@ -65,24 +106,29 @@ class SocialMediaManager:
                 access_token_secret=os.getenv('TWITTER_ACCESS_SECRET')
             )
             
-            # Initialize API v1.1 for media upload
+            return client
+        except Exception as e:
+            print(f"Error initializing Twitter client: {e}")
+            return None
+
+    def _init_twitter_api(self) -> Optional[tweepy.API]:
+        """Initialize Twitter API v1.1 for media upload."""
+        try:
             auth = tweepy.OAuth1UserHandler(
                 os.getenv('TWITTER_API_KEY'),
                 os.getenv('TWITTER_API_SECRET'),
                 os.getenv('TWITTER_ACCESS_TOKEN'),
                 os.getenv('TWITTER_ACCESS_SECRET')
             )
-            self.twitter_api = tweepy.API(auth)
-            
-            return client
+            return tweepy.API(auth)
         except Exception as e:
-            print(f"Error initializing Twitter client: {e}")
+            print(f"Error initializing Twitter API: {e}")
             return None
 
-    def _init_facebook(self) -> Optional[facebook.GraphAPI]:
+    def _init_facebook(self) -> Optional[facebook_sdk.GraphAPI]:
         """Initialize Facebook client."""
         try:
-            return facebook.GraphAPI(
+            return facebook_sdk.GraphAPI(
                 access_token=os.getenv('FACEBOOK_ACCESS_TOKEN'),
                 version="3.1"
             )
@@ -90,14 +136,19 @@ class SocialMediaManager:
             print(f"Error initializing Facebook client: {e}")
             return None
 
-    def post_to_instagram(self, media_path: str, caption: str, hashtags: str) -> bool:
-        """Post media to Instagram."""
+    def post_to_instagram(self, media_path: str, caption: str, hashtags: str,
+                          mime_type: Optional[str] = None) -> bool:
+        """Post media to Instagram.
+
+        Pass the mime_type probed at ingest to avoid sniffing the file again.
+        """
         try:
             if not self.instagram:
                 raise Exception("Instagram client not initialized")
 
             path = Path(media_path)
-            mime_type = magic.from_file(str(path), mime=True)
+            if mime_type is None:
+                mime_type = magic.from_file(str(path), mime=True)
             
             # Combine caption and hashtags
             full_caption = f"{caption}\n.\n.\n.\n{hashtags}"
@@ -119,8 +170,13 @@ class SocialMediaManager:
             print(f"Error posting to Instagram: {e}")
             return False
 
-    def post_to_twitter(self, media_path: str, caption: str, hashtags: str) -> bool:
-        """Post media to Twitter using v2 API."""
+    def post_to_twitter(self, media_path: str, caption: str, hashtags: str,
+                        mime_type: Optional[str] = None) -> bool:
+        """Post media to Twitter using v2 API.
+
+        Pass the mime_type probed at ingest; without it the media type is
+        guessed from the file extension.
+        """
         try:
             if not self.twitter or not self.twitter_api:
                 raise Exception("Twitter client not initialized")
@@ -133,7 +189,10 @@ class SocialMediaManager:
 
             # Upload media using v1.1 API
             path = Path(media_path)
-            media_type = 'video' if path.suffix.lower() in ['.mp4', '.mov', '.avi'] else 'image'
+            if mime_type is not None:
+                media_type = 'video' if mime_type.startswith('video/') else 'image'
+            else:
+                media_type = 'video' if path.suffix.lower() in ['.mp4', '.mov', '.avi'] else 'image'
             
             if media_type == 'video':
                 media = self.twitter_api.media_upload(
@@ -0,0 +1,65 @@
+import pytest
+
+from db import Database, count_queries, epoch_ms
+from migrations import migrate
+from repository import ContentRepository
+
+PLATFORMS = ['Instagram', 'Twitter', 'Facebook', 'TikTok']
+
+def seed_posts(db, count):
+    """Insert ``count`` analyses, each scheduled and posted with engagement metrics."""
+    with db.write() as conn:
+        analysis_ids = []
+        for i in range(count):
+            analysis_ids.append(conn.execute('''
+            INSERT INTO content_analysis (file_path, original_filename, media_type, total_score, caption)
+            VALUES (?, ?, 'image', 30, 'caption')
+            ''', (f'/media/cat_{i}.jpg', f'cat_{i}.jpg')).lastrowid)
+        for analysis_id in analysis_ids:
+            for platform in PLATFORMS:
+                conn.execute('''
+                INSERT INTO posting_history (analysis_id, platform, status, posted_at_ms, posted_at)
+                VALUES (?, ?, 'posted', ?, datetime(? / 1000, 'unixepoch'))
+                ''', (analysis_id, platform, epoch_ms(), epoch_ms()))
+                conn.execute('''
+                INSERT INTO engagement_metrics (post_id, platform, likes, comments, shares, views)
+                VALUES (?, ?, 10, 2, 1, 100)
+                ''', (analysis_id, platform))
+    return analysis_ids
+
+def page_queries(repository, analysis_ids):
+    """Run the lookups the pending posts and posted content pages make, counting statements."""
+    with count_queries() as statements:
+        history = repository.posting_history_by_analysis(analysis_ids)
+        metrics = repository.engagement_metrics_by_post(
+            (analysis_id, platform) for analysis_id in analysis_ids for platform in PLATFORMS
+        )
+    assert set(history) == set(analysis_ids)
+    assert len(metrics) == len(analysis_ids) * len(PLATFORMS)
+    return len(statements)
+
+@pytest.fixture
+def repository(tmp_path):
+    db = Database(str(tmp_path / 'cat_content.db'))
+    migrate(db)
+    return ContentRepository(db)
+
+@pytest.mark.parametrize('count', [10, 200])
+def test_page_query_count_does_not_grow_with_posts(repository, count):
+    one = page_queries(repository, seed_posts(repository.db, 1))
+    many = page_queries(repository, seed_posts(repository.db, count))
+    assert many == one
+
+def test_find_content_query_count_does_not_grow_with_matches(repository):
+    seed_posts(repository.db, 1)
+    # FTS5 reads its configuration once per connection; keep that out of the counts
+    repository.find_content('caption')
+    with count_queries() as statements:
+        repository.find_content('caption')
+    one = len(statements)
+
+    seed_posts(repository.db, 200)
+    with count_queries() as statements:
+        rows, total = repository.find_content('caption')
+    assert total == 201
+    assert len(statements) == one
@@ -0,0 +1,247 @@
+import os
+import uuid
+import threading
+import subprocess
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageOps
+
+from media_store import compute_file_hash, blob_hash
+from media_processing import sample_video_frames
+
+# Directory holding generated previews
+THUMBNAIL_CACHE_DIR = os.getenv('THUMBNAIL_CACHE_DIR', 'thumbnail_cache')
+# Least recently used previews are evicted once the cache grows past this size
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv('THUMBNAIL_CACHE_MAX_MB', 500)) * 1024 * 1024
+# Worker processes used to generate previews
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', min(4, os.cpu_count() or 1)))
+THUMBNAIL_JPEG_QUALITY = 85
+# Preview clips are re-encoded at this video bitrate and cut to this length
+VIDEO_PREVIEW_BITRATE = os.getenv('VIDEO_PREVIEW_BITRATE', '500k')
+VIDEO_PREVIEW_MAX_SECONDS = int(os.getenv('VIDEO_PREVIEW_MAX_SECONDS', 30))
+
+# Bounding boxes (width, height) for the previews the control center shows
+DISPLAY_SIZE = (800, 1200)
+GRID_SIZE = (400, 400)
+PREVIEW_SIZE = (640, 640)
+
+def render_thumbnail(source, dest, size, quality=THUMBNAIL_JPEG_QUALITY):
+    """Write a JPEG preview of an image that fits within size.
+
+    Runs in a worker process. JPEGs are decoded in draft mode, which lets
+    libjpeg scale by 1/2, 1/4 or 1/8 while decoding instead of decoding at
+    full resolution and resizing afterwards.
+    """
+    with Image.open(source) as img:
+        if img.format == 'JPEG':
+            img.draft('RGB', size)
+        img = ImageOps.exif_transpose(img)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        tmp_path = f"{dest}.{uuid.uuid4().hex}.part"
+        img.save(tmp_path, format='JPEG', quality=quality)
+    os.replace(tmp_path, dest)
+    return dest
+
+def render_poster(source, dest, size, quality=THUMBNAIL_JPEG_QUALITY):
+    """Write a JPEG poster frame for a video that fits within size.
+
+    Runs in a worker process and decodes a single frame from the middle of
+    the clip, which is less likely to be black than the first one.
+    """
+    _, frame = sample_video_frames(source, num_frames=1, max_edge=max(size))[0]
+    frame.thumbnail(size, Image.Resampling.LANCZOS)
+    tmp_path = f"{dest}.{uuid.uuid4().hex}.part"
+    frame.save(tmp_path, format='JPEG', quality=quality)
+    os.replace(tmp_path, dest)
+    return dest
+
+def render_preview_clip(source, dest, size, bitrate=VIDEO_PREVIEW_BITRATE,
+                        max_seconds=VIDEO_PREVIEW_MAX_SECONDS):
+    """Write a small H.264 MP4 preview of a video that fits within size.
+
+    Runs in a worker process. The clip is downscaled, re-encoded at a low
+    bitrate and cut to max_seconds by a single ffmpeg call (the binary
+    moviepy is configured with), with the index at the front of the file so
+    the browser can start playing it before it has fully loaded.
+    """
+    from moviepy.config import get_setting
+    tmp_path = f"{dest}.{uuid.uuid4().hex}.part"
+    try:
+        subprocess.run([
+            get_setting('FFMPEG_BINARY'), '-y', '-loglevel', 'error',
+            '-i', str(source),
+            '-t', str(max_seconds),
+            '-vf', (f"scale=w={size[0]}:h={size[1]}:force_original_aspect_ratio=decrease,"
+                    "scale=trunc(iw/2)*2:trunc(ih/2)*2"),
+            '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', bitrate, '-maxrate', bitrate,
+            '-bufsize', bitrate, '-pix_fmt', 'yuv420p',
+            '-c:a', 'aac', '-b:a', '64k',
+            '-movflags', '+faststart', '-f', 'mp4', tmp_path
+        ], check=True, capture_output=True)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return dest
+
+# Renderer and file extension for each kind of cached preview
+PREVIEW_KINDS = {
+    'thumb': (render_thumbnail, '.jpg'),
+    'poster': (render_poster, '.jpg'),
+    'preview': (render_preview_clip, '.mp4'),
+}
+
+class ThumbnailCache:
+    """On-disk preview cache keyed by content hash and target size.
+
+    Image thumbnails, video poster frames and low-bitrate video preview
+    clips (see ``PREVIEW_KINDS``) are generated in a process pool so
+    decoding large originals never blocks the Streamlit script thread, and
+    a preview's mtime is refreshed on every hit so eviction can drop the
+    least recently used files once the cache exceeds ``max_bytes``.
+    """
+
+    def __init__(self, root=THUMBNAIL_CACHE_DIR, max_bytes=THUMBNAIL_CACHE_MAX_BYTES,
+                 workers=THUMBNAIL_WORKERS):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._pool = None
+        self._pending = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._cached_files())
+
+    def _cached_files(self):
+        """All finished previews in the cache directory."""
+        suffixes = {suffix for _, suffix in PREVIEW_KINDS.values()}
+        return [path for path in self.root.rglob('*') if path.suffix in suffixes]
+
+    def _content_hash(self, file_path, file_hash=None):
+        """Content hash for a file, hashing it at most once per size and mtime.
+
+        Media store blobs are named after their hash, so only files outside
+        the store are read.
+        """
+        file_hash = file_hash or blob_hash(file_path)
+        if file_hash:
+            return file_hash
+        stat = os.stat(file_path)
+        key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._hashes.get(key)
+        if cached is None:
+            cached = compute_file_hash(file_path)
+            with self._lock:
+                self._hashes[key] = cached
+        return cached
+
+    def path_for(self, file_hash, size, kind='thumb'):
+        """Cache location for a preview of the given content, size and kind."""
+        _, suffix = PREVIEW_KINDS[kind]
+        return self.root / file_hash[:2] / f"{file_hash}_{kind}_{size[0]}x{size[1]}{suffix}"
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _submit(self, fn, file_path, dest, *args):
+        """Start generating a preview unless it is cached or already queued."""
+        dest = str(dest)
+        with self._lock:
+            future = self._pending.get(dest)
+            if future is not None:
+                return future
+            try:
+                future = self._get_pool().submit(fn, str(file_path), dest, *args)
+            except (BrokenProcessPool, RuntimeError):
+                # Start over with a fresh pool if a worker died
+                self._pool = None
+                future = self._get_pool().submit(fn, str(file_path), dest, *args)
+            self._pending[dest] = future
+        # Outside the lock: the callback runs right away if the future is already done
+        future.add_done_callback(lambda done: self._completed(dest, done))
+        return future
+
+    def _completed(self, dest, future):
+        """Account for a finished preview and evict old ones if the cache is full."""
+        with self._lock:
+            self._pending.pop(dest, None)
+            if future.cancelled() or future.exception() is not None or not os.path.exists(dest):
+                return
+            self._size += os.path.getsize(dest)
+            over_limit = self._size > self.max_bytes
+        if over_limit:
+            self.evict()
+
+    def _touch(self, path):
+        """Mark a cached preview as recently used."""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def get(self, file_path, size=DISPLAY_SIZE, file_hash=None, kind='thumb'):
+        """Return the path of a cached preview, generating it if needed."""
+        dest = self.path_for(self._content_hash(file_path, file_hash), size, kind)
+        if self._touch(dest):
+            return dest
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        render, _ = PREVIEW_KINDS[kind]
+        self._submit(render, file_path, dest, size).result()
+        return dest
+
+    def prefetch(self, file_paths, size=GRID_SIZE, kind='thumb', file_hashes=None):
+        """Queue previews for many files at once so the pool renders them in parallel.
+
+        ``file_hashes``, when given, holds the stored content hash (or None)
+        of each file in ``file_paths``.
+        """
+        render, _ = PREVIEW_KINDS[kind]
+        file_paths = list(file_paths)
+        file_hashes = list(file_hashes) if file_hashes is not None else [None] * len(file_paths)
+        for file_path, file_hash in zip(file_paths, file_hashes):
+            try:
+                dest = self.path_for(self._content_hash(file_path, file_hash), size, kind)
+                if not dest.exists():
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    self._submit(render, file_path, dest, size)
+            except OSError:
+                continue
+
+    def evict(self, target_ratio=0.9):
+        """Delete least recently used previews until the cache is under target_ratio of max_bytes."""
+        files = []
+        for path in self._cached_files():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * target_ratio
+        for _, size, path in files:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        with self._lock:
+            self._size = total
+
+_thumbnail_cache = None
+_thumbnail_cache_lock = threading.Lock()
+
+def get_thumbnail_cache():
+    """Get the process-wide thumbnail cache."""
+    global _thumbnail_cache
+    with _thumbnail_cache_lock:
+        if _thumbnail_cache is None:
+            _thumbnail_cache = ThumbnailCache()
+        return _thumbnail_cache